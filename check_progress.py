@@ -1,18 +1,18 @@
 #!/usr/bin/env python3
 """進捗状況を確認してGitHub Actions出力形式で出力"""
 
-import json
+import ijson
 from pathlib import Path
 
 results_file = Path('output/analysis_results.json')
 
+count = 0
 if results_file.exists():
-    with open(results_file, 'r') as f:
-        results = json.load(f)
-    successful = [r for r in results if not r.get('error')]
-    count = len(successful)
-else:
-    count = 0
+    # 結果ファイル全体を展開せず、1件ずつ読み出して成功件数を数える
+    with open(results_file, 'rb') as f:
+        for r in ijson.items(f, 'item'):
+            if not r.get('error'):
+                count += 1
 
 is_complete = 'true' if count >= 500 else 'false'
 
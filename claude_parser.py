@@ -2,10 +2,18 @@
 Claude APIを使用した有価証券報告書の不動産情報解析モジュール
 """
 
+import asyncio
+import hashlib
 import os
 import json
+import time
+from pathlib import Path
 from typing import List, Dict, Optional
-from anthropic import Anthropic
+import orjson
+import pandas as pd
+from anthropic import Anthropic, AsyncAnthropic
+
+from prefectures import PREFECTURE_RE
 
 
 class PropertyExtractor:
@@ -43,9 +51,23 @@ class PropertyExtractor:
 6. 情報が不明な場合はnullとしてください
 7. 必ず有効なJSONのみを出力してください（説明文は不要）"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    MODEL = "claude-sonnet-4-20250514"
+
+    # batch_extract で同時に投げるリクエスト数の上限
+    MAX_CONCURRENT_REQUESTS = 8
+
+    # この件数を超える batch_extract は Message Batches API で処理する
+    BATCH_API_THRESHOLD = 50
+    BATCH_POLL_INTERVAL = 60  # 秒
+
+    # 有報テキストに割り当てる入力トークン数の上限
+    MAX_REPORT_TOKENS = 30000
+
+    def __init__(self, api_key: Optional[str] = None, cache_dir: str = "./cache/claude"):
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY", "")
         self.client = Anthropic(api_key=self.api_key)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
 
     def extract_properties(self, report_text: str, company_name: str) -> Dict:
         """
@@ -58,10 +80,86 @@ class PropertyExtractor:
         Returns:
             抽出された不動産情報のDict
         """
-        # テキストが長すぎる場合は切り詰め
-        max_length = 50000
-        if len(report_text) > max_length:
-            report_text = report_text[:max_length] + "\n... (以下省略)"
+        cache_key = self._cache_key(report_text, company_name)
+        cached = self._load_cached_result(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            response = self.client.messages.create(
+                **self._build_request(report_text, company_name)
+            )
+
+            # レスポンスからJSONを抽出
+            content = response.content[0].text
+            extracted = self._parse_json_response(content)
+
+        except Exception as e:
+            return self._api_error_result(e)
+
+        self._save_cached_result(cache_key, extracted)
+        return extracted
+
+    async def _extract_properties_async(
+        self,
+        aclient: AsyncAnthropic,
+        report_text: str,
+        company_name: str
+    ) -> Dict:
+        """extract_properties の非同期版"""
+        cache_key = self._cache_key(report_text, company_name)
+        cached = self._load_cached_result(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            # トークン数の計測は同期APIなのでスレッドで実行する
+            request = await asyncio.to_thread(
+                self._build_request, report_text, company_name
+            )
+            response = await aclient.messages.create(**request)
+
+            # レスポンスからJSONを抽出
+            content = response.content[0].text
+            extracted = self._parse_json_response(content)
+
+        except Exception as e:
+            return self._api_error_result(e)
+
+        self._save_cached_result(cache_key, extracted)
+        return extracted
+
+    def _cache_key(self, report_text: str, company_name: str) -> str:
+        """抽出結果キャッシュのキー（入力とプロンプト・モデルが同じなら同じ結果とみなす）"""
+        digest = hashlib.blake2b(digest_size=32)
+        for part in (self.MODEL, self.SYSTEM_PROMPT, str(self.MAX_REPORT_TOKENS),
+                     company_name, report_text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _load_cached_result(self, cache_key: str) -> Optional[Dict]:
+        """キャッシュ済みの抽出結果を読み込む"""
+        cache_path = self.cache_dir / f"{cache_key}.json"
+        if not cache_path.exists():
+            return None
+
+        try:
+            return orjson.loads(cache_path.read_bytes())
+        except Exception:
+            return None
+
+    def _save_cached_result(self, cache_key: str, extracted: Dict):
+        """抽出に成功した結果のみキャッシュに保存"""
+        if extracted.get("error"):
+            return
+
+        cache_path = self.cache_dir / f"{cache_key}.json"
+        cache_path.write_bytes(orjson.dumps(extracted))
+
+    def _build_request(self, report_text: str, company_name: str) -> Dict:
+        """messages.create に渡すパラメータを組み立てる"""
+        report_text = self._truncate_report(report_text)
 
         user_prompt = f"""以下は「{company_name}」の有価証券報告書から抽出した「主要な設備の状況」セクションです。
 この中から不動産（土地・建物）に関する情報を抽出し、指定されたJSON形式で出力してください。
@@ -72,42 +170,99 @@ class PropertyExtractor:
 
 JSONのみを出力してください。"""
 
+        return {
+            "model": self.MODEL,
+            "max_tokens": 4096,
+            # システムプロンプトは全企業で共通なのでプロンプトキャッシュの対象にする
+            "system": [
+                {
+                    "type": "text",
+                    "text": self.SYSTEM_PROMPT,
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ],
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ]
+        }
+
+    def _truncate_report(self, report_text: str) -> str:
+        """
+        有報テキストを MAX_REPORT_TOKENS トークン以内に切り詰める
+
+        日本語は1文字あたりのトークン数が一定でないため、
+        文字数ではなく count_tokens で実際のトークン数を計測して切り詰める
+        """
+        # 1文字2トークンでも収まる長さなら計測不要
+        if len(report_text) * 2 <= self.MAX_REPORT_TOKENS:
+            return report_text
+
+        text = report_text
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=4096,
-                system=self.SYSTEM_PROMPT,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ]
-            )
+            for _ in range(3):
+                tokens = self.client.messages.count_tokens(
+                    model=self.MODEL,
+                    messages=[{"role": "user", "content": text}]
+                ).input_tokens
 
-            # レスポンスからJSONを抽出
-            content = response.content[0].text
-            return self._parse_json_response(content)
+                if tokens <= self.MAX_REPORT_TOKENS:
+                    break
 
-        except Exception as e:
-            return {
-                "properties": [],
-                "error": str(e),
-                "extraction_notes": "Claude APIエラー"
-            }
+                # トークン/文字の比率から収まる文字数を見積もって再計測
+                text = text[:int(len(text) * self.MAX_REPORT_TOKENS / tokens * 0.95)]
+
+        except Exception:
+            # 計測できない場合は1文字1トークン以上とみなして切り詰め
+            text = report_text[:self.MAX_REPORT_TOKENS]
+
+        if len(text) < len(report_text):
+            text += "\n... (以下省略)"
+
+        return text
+
+    def _api_error_result(self, error) -> Dict:
+        """API呼び出し失敗時の結果"""
+        return {
+            "properties": [],
+            "error": str(error),
+            "extraction_notes": "Claude APIエラー"
+        }
 
     def _parse_json_response(self, content: str) -> Dict:
-        """レスポンスからJSONをパース"""
+        """
+        レスポンスからJSONをパース
+
+        1. そのままパース（大半のレスポンスはJSONのみ）
+        2. ```json ブロックを取り出してパース
+        3. 最初の { から最後の } までを取り出してパース
+        """
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+
         # JSONブロックを探す
         if "```json" in content:
             start = content.find("```json") + 7
             end = content.find("```", start)
-            content = content[start:end].strip()
+            fenced = content[start:end].strip()
         elif "```" in content:
             start = content.find("```") + 3
             end = content.find("```", start)
-            content = content[start:end].strip()
+            fenced = content[start:end].strip()
+        else:
+            fenced = None
 
+        if fenced is not None:
+            try:
+                return orjson.loads(fenced)
+            except orjson.JSONDecodeError:
+                pass
+
+        # 前後に説明文が付いている場合は波括弧の範囲を取り出す
         try:
-            return json.loads(content)
-        except json.JSONDecodeError as e:
+            return orjson.loads(content[content.find("{"):content.rfind("}") + 1])
+        except orjson.JSONDecodeError as e:
             return {
                 "properties": [],
                 "error": f"JSONパースエラー: {e}",
@@ -117,43 +272,149 @@ JSONのみを出力してください。"""
     def batch_extract(
         self,
         reports: List[Dict],
-        progress_callback=None
+        progress_callback=None,
+        use_batch_api: Optional[bool] = None
     ) -> List[Dict]:
         """
         複数企業の有報を一括処理
 
+        通常は最大 MAX_CONCURRENT_REQUESTS 件を並行してClaude APIに問い合わせる。
+        件数が多い場合は Message Batches API（料金半額・最大24時間で完了）を使う。
+        結果は reports と同じ順序で返す。
+
         Args:
             reports: [{"company_name": "...", "report_text": "..."}, ...]
-            progress_callback: 進捗コールバック関数
+            progress_callback: 進捗コールバック関数（1件完了するごとに呼ばれる）
+            use_batch_api: Message Batches API を使うか。
+                Noneの場合は件数が BATCH_API_THRESHOLD を超えたら使う
 
         Returns:
             抽出結果のリスト
         """
-        results = []
+        if use_batch_api is None:
+            use_batch_api = len(reports) > self.BATCH_API_THRESHOLD
+
+        if use_batch_api:
+            return self._batch_extract_via_batch_api(reports, progress_callback)
+
+        return asyncio.run(self._batch_extract_async(reports, progress_callback))
+
+    def _batch_extract_via_batch_api(
+        self,
+        reports: List[Dict],
+        progress_callback=None
+    ) -> List[Dict]:
+        """Message Batches API で一括抽出"""
+        results: List[Optional[Dict]] = [None] * len(reports)
+        cache_keys: Dict[int, str] = {}
+        batch_requests = []
 
         for i, report in enumerate(reports):
             company_name = report.get("company_name", "不明")
             report_text = report.get("report_text", "")
 
-            if progress_callback:
-                progress_callback(i + 1, len(reports), company_name)
-
             if not report_text:
-                results.append({
+                results[i] = {
                     "company_name": company_name,
                     "properties": [],
                     "error": "有報テキストがありません"
-                })
+                }
+                continue
+
+            cache_keys[i] = self._cache_key(report_text, company_name)
+            cached = self._load_cached_result(cache_keys[i])
+            if cached is not None:
+                cached["company_name"] = company_name
+                cached["stock_code"] = report.get("stock_code")
+                results[i] = cached
                 continue
 
-            extracted = self.extract_properties(report_text, company_name)
-            extracted["company_name"] = company_name
-            extracted["stock_code"] = report.get("stock_code")
+            batch_requests.append({
+                "custom_id": f"report-{i}",
+                "params": self._build_request(report_text, company_name)
+            })
+
+        completed = sum(1 for r in results if r is not None)
+        error = "バッチ結果が返されませんでした"
+
+        try:
+            if batch_requests:
+                batch = self.client.messages.batches.create(requests=batch_requests)
+
+                while batch.processing_status != "ended":
+                    time.sleep(self.BATCH_POLL_INTERVAL)
+                    batch = self.client.messages.batches.retrieve(batch.id)
+
+                for entry in self.client.messages.batches.results(batch.id):
+                    i = int(entry.custom_id.split("-")[1])
 
-            results.append(extracted)
+                    if entry.result.type == "succeeded":
+                        content = entry.result.message.content[0].text
+                        extracted = self._parse_json_response(content)
+                        self._save_cached_result(cache_keys[i], extracted)
+                    else:
+                        extracted = self._api_error_result(
+                            f"バッチ処理が完了しませんでした ({entry.result.type})"
+                        )
+
+                    extracted["company_name"] = reports[i].get("company_name", "不明")
+                    extracted["stock_code"] = reports[i].get("stock_code")
+                    results[i] = extracted
+
+                    completed += 1
+                    if progress_callback:
+                        progress_callback(completed, len(reports), extracted["company_name"])
+
+        except Exception as e:
+            error = e
+
+        # 結果が得られなかった企業はエラーとして返す
+        for i, report in enumerate(reports):
+            if results[i] is None:
+                results[i] = self._api_error_result(error)
+                results[i]["company_name"] = report.get("company_name", "不明")
+                results[i]["stock_code"] = report.get("stock_code")
 
         return results
 
+    async def _batch_extract_async(
+        self,
+        reports: List[Dict],
+        progress_callback=None
+    ) -> List[Dict]:
+        """batch_extract の非同期実装"""
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        completed = 0
+
+        async with AsyncAnthropic(api_key=self.api_key) as aclient:
+
+            async def extract_one(report: Dict) -> Dict:
+                nonlocal completed
+                company_name = report.get("company_name", "不明")
+                report_text = report.get("report_text", "")
+
+                if not report_text:
+                    extracted = {
+                        "company_name": company_name,
+                        "properties": [],
+                        "error": "有報テキストがありません"
+                    }
+                else:
+                    async with semaphore:
+                        extracted = await self._extract_properties_async(
+                            aclient, report_text, company_name
+                        )
+                    extracted["company_name"] = company_name
+                    extracted["stock_code"] = report.get("stock_code")
+
+                completed += 1
+                if progress_callback:
+                    progress_callback(completed, len(reports), company_name)
+
+                return extracted
+
+            return await asyncio.gather(*[extract_one(r) for r in reports])
+
 
 class PropertyAnalyzer:
     """抽出された不動産情報の分析"""
@@ -185,53 +446,45 @@ class PropertyAnalyzer:
             "by_prefecture": {}
         }
 
-        for prop in properties:
-            summary["total_properties"] += 1
-
-            if prop.get("type") == "自社保有":
-                summary["owned_properties"] += 1
-            else:
-                summary["leased_properties"] += 1
-
-            if prop.get("land_area_sqm"):
-                summary["total_land_area_sqm"] += prop["land_area_sqm"]
-
-            if prop.get("building_area_sqm"):
-                summary["total_building_area_sqm"] += prop["building_area_sqm"]
-
-            if prop.get("book_value_million_yen"):
-                summary["total_land_book_value_million_yen"] += prop["book_value_million_yen"]
-
-            # 用途別集計
-            purpose = prop.get("purpose", "不明")
-            summary["by_purpose"][purpose] = summary["by_purpose"].get(purpose, 0) + 1
-
-            # 都道府県別集計
-            address = prop.get("address", "")
-            prefecture = PropertyAnalyzer._extract_prefecture(address)
-            if prefecture:
-                summary["by_prefecture"][prefecture] = summary["by_prefecture"].get(prefecture, 0) + 1
+        if not properties:
+            return summary
+
+        df = pd.DataFrame(properties).reindex(columns=[
+            "type", "address", "purpose",
+            "land_area_sqm", "building_area_sqm", "book_value_million_yen"
+        ])
+
+        summary["total_properties"] = len(df)
+        summary["owned_properties"] = int((df["type"] == "自社保有").sum())
+        summary["leased_properties"] = len(df) - summary["owned_properties"]
+
+        # 数値以外（null・文字列）は NaN として除外し、3列を1回の集計でまとめて合計
+        totals = (
+            df[["land_area_sqm", "building_area_sqm", "book_value_million_yen"]]
+            .apply(pd.to_numeric, errors="coerce")
+            .astype("float64")
+            .sum()
+        )
+        summary["total_land_area_sqm"] = totals["land_area_sqm"].item()
+        summary["total_building_area_sqm"] = totals["building_area_sqm"].item()
+        summary["total_land_book_value_million_yen"] = totals["book_value_million_yen"].item()
+
+        # 用途別集計
+        by_purpose = df["purpose"].fillna("不明").value_counts(sort=False)
+        summary["by_purpose"] = {k: int(v) for k, v in by_purpose.items()}
+
+        # 都道府県別集計
+        prefectures = df["address"].fillna("").str.extract(PREFECTURE_RE, expand=False)
+        by_prefecture = prefectures.dropna().value_counts(sort=False)
+        summary["by_prefecture"] = {k: int(v) for k, v in by_prefecture.items()}
 
         return summary
 
     @staticmethod
     def _extract_prefecture(address: str) -> Optional[str]:
         """住所から都道府県を抽出"""
-        prefectures = [
-            "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
-            "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
-            "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県",
-            "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県",
-            "奈良県", "和歌山県", "鳥取県", "島根県", "岡山県", "広島県", "山口県",
-            "徳島県", "香川県", "愛媛県", "高知県", "福岡県", "佐賀県", "長崎県",
-            "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県"
-        ]
-
-        for pref in prefectures:
-            if pref in address:
-                return pref
-
-        return None
+        match = PREFECTURE_RE.search(address)
+        return match.group(0) if match else None
 
 
 def main():
@@ -3,15 +3,207 @@ EDINET API連携モジュール
 有価証券報告書の取得・解析
 """
 
+import asyncio
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
+from lxml import html as lxml_html
 import zipfile
-import io
+import zlib
+import gzip
+import orjson
 import os
 import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Tuple
+from typing import BinaryIO, Iterable, Optional, Dict, List, Tuple, Union
 from pathlib import Path
-import time
+
+
+try:
+    from isal import isal_zlib
+except ImportError:  # ISA-L のホイールがない環境では標準の zlib で展開する
+    isal_zlib = None
+
+
+if isal_zlib is not None:
+
+    class _ISALZlib:
+        """zipfile の展開処理（inflate・CRC計算）だけを ISA-L 実装に差し替える zlib 互換オブジェクト"""
+
+        decompressobj = staticmethod(isal_zlib.decompressobj)
+        crc32 = staticmethod(isal_zlib.crc32)
+
+        def __getattr__(self, name):
+            return getattr(zlib, name)
+
+    # XBRLパッケージの展開を SIMD 化された inflate で高速化（圧縮側は標準 zlib のまま）
+    zipfile.zlib = _ISALZlib()
+    # zipfile はCRC計算に読み込み時にコピーした crc32 を使うため、こちらも差し替える
+    zipfile.crc32 = isal_zlib.crc32
+
+# XBRLのHTMLはUTF-8（XML宣言付き）なのでバイト列として解析する
+_HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+
+# 設備セクションの目印（「主要な設備の状況」もこれに含まれる）
+_PROPERTY_SECTION_MARKER = '設備の状況'.encode('utf-8')
+
+# _clean_html 用の正規表現（モジュール読み込み時に一度だけコンパイル）
+_SCRIPT_RE = re.compile(r'<script[^>]*>.*?</script>', re.DOTALL)
+_STYLE_RE = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+
+
+def _atomic_write(path: Path, chunks: Iterable[bytes]):
+    """一時ファイルに書き込んでから置き換え、書きかけのファイルを残さない"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _RateLimiter:
+    """
+    リクエストの発行間隔を一定に保つ簡易レートリミッター
+
+    発行枠の予約はスレッドロックで行うため、
+    複数スレッド・複数イベントループから共有できる。
+    share() でプロセス間の共有状態を渡すと、複数プロセスからも共有できる
+    """
+
+    def __init__(self, requests_per_second: float):
+        self._interval = 1.0 / requests_per_second
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+        # プロセス間で共有するロックと次の発行可能時刻（Manager のプロキシ）
+        self._shared = None
+
+    def share(self, lock, next_time):
+        """
+        プロセス間で共有するロックと次の発行可能時刻を使うようにする
+
+        Args:
+            lock: multiprocessing.Manager().Lock()
+            next_time: multiprocessing.Manager().Value("d", 0.0)
+        """
+        self._shared = (lock, next_time)
+
+    async def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._shared is None:
+                slot = max(now, self._next_time)
+                self._next_time = slot + self._interval
+            else:
+                # 予約だけをプロセス間ロックの中で行い、待機はロックの外で行う
+                lock, next_time = self._shared
+                with lock:
+                    slot = max(now, next_time.value)
+                    next_time.value = slot + self._interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class EDINETIndex:
+    """
+    書類一覧のローカルインデックス（SQLite）
+
+    一度取得した日付の書類一覧を保存しておき、
+    企業ごとに同じ日付の書類一覧APIを叩き直さないようにする
+    """
+
+    def __init__(self, db_path: Path):
+        # AnnualReportFetcher.fetch_many から複数スレッドで共有するためロックで直列化
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                edinet_code TEXT,
+                doc_id TEXT,
+                doc_type TEXT,
+                period_end TEXT,
+                submit_date TEXT,
+                doc_json TEXT,
+                PRIMARY KEY (doc_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_edinet_code
+                ON documents (edinet_code);
+            CREATE TABLE IF NOT EXISTS indexed_dates (
+                date TEXT PRIMARY KEY
+            );
+        """)
+
+    def indexed_dates(self, dates: List[str]) -> set:
+        """指定日付のうちインデックス済みのものを返す"""
+        placeholders = ",".join("?" * len(dates))
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT date FROM indexed_dates WHERE date IN ({placeholders})",
+                dates
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def add_documents(self, date: str, docs: List[Dict], complete: bool = True):
+        """
+        指定日の書類一覧を登録
+
+        Args:
+            date: 書類一覧の日付
+            docs: 書類情報のリスト
+            complete: その日の一覧が確定済みか（当日分は追加提出があるためFalse）
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        doc.get("edinetCode"),
+                        doc.get("docID"),
+                        doc.get("docTypeCode"),
+                        doc.get("periodEnd"),
+                        date,
+                        orjson.dumps(doc).decode("utf-8")
+                    )
+                    for doc in docs
+                ]
+            )
+            if complete:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO indexed_dates VALUES (?)", (date,)
+                )
+
+    def find_annual_report(
+        self,
+        edinet_code: str,
+        dates: List[str],
+        doc_type: str = "120"
+    ) -> Optional[Dict]:
+        """指定日付の範囲から最新の書類を検索"""
+        placeholders = ",".join("?" * len(dates))
+        with self._lock:
+            row = self.conn.execute(
+                f"""
+                SELECT doc_json FROM documents
+                WHERE edinet_code = ? AND doc_type = ? AND submit_date IN ({placeholders})
+                ORDER BY submit_date DESC, period_end DESC
+                LIMIT 1
+                """,
+                [edinet_code, doc_type, *dates]
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
 
 
 class EDINETClient:
@@ -19,10 +211,49 @@ class EDINETClient:
 
     BASE_URL = "https://api.edinet-fsa.go.jp/api/v2"
 
+    # 書類一覧APIの同時リクエスト数と秒間リクエスト数の上限
+    MAX_CONCURRENT_REQUESTS = 16
+    REQUESTS_PER_SECOND = 10
+
+    # 設備セクションを含みうるHTMLファイルの最小サイズ（展開後のバイト数）
+    MIN_SECTION_FILE_SIZE = 10_000
+
+    # 当日以降の書類一覧キャッシュの有効期間（秒）。過去日の一覧は確定済みとして常に再利用
+    LIST_CACHE_TTL = 6 * 60 * 60
+
     def __init__(self, api_key: Optional[str] = None, cache_dir: str = "./cache/edinet"):
         self.api_key = api_key or os.environ.get("EDINET_API_KEY", "")
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index = EDINETIndex(self.cache_dir / "index.db")
+
+        # 複数スレッドから検索しても全体で REQUESTS_PER_SECOND を超えないよう共有する
+        self._limiter = _RateLimiter(self.REQUESTS_PER_SECOND)
+
+        # TCP/TLS接続を使い回すためのセッション（Sessionはスレッドセーフでないためスレッドごとに持つ）
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["Accept-Encoding"] = "gzip"
+            retry = Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+            session.mount(
+                "https://",
+                HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+            )
+            self._local.session = session
+        return session
+
+    def share_rate_limit(self, lock, next_time):
+        """レート制限をプロセス間で共有する（プロセス並列時にワーカーの初期化で呼ぶ）"""
+        self._limiter.share(lock, next_time)
 
     def get_document_list(
         self,
@@ -49,28 +280,91 @@ class EDINETClient:
             "Subscription-Key": self.api_key
         }
 
+        cached = self._load_cached_list(date)
+        if cached is not None:
+            return self._filter_documents(cached, doc_type) or []
+
         try:
-            response = requests.get(url, params=params, timeout=30)
+            response = self.session.get(url, params=params, timeout=30)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
+            self._save_cached_list(date, data)
+            return self._filter_documents(data, doc_type) or []
+
+        except Exception as e:
+            print(f"書類一覧取得エラー: {e}")
+            return []
 
-            if data.get("metadata", {}).get("status") != "200":
-                print(f"EDINET API エラー: {data}")
-                return []
+    async def _get_document_list_async(
+        self,
+        session: aiohttp.ClientSession,
+        date: str,
+        limiter: _RateLimiter,
+        doc_type: str = "120"
+    ) -> Optional[List[Dict]]:
+        """get_document_list の非同期版（取得失敗時はNone）"""
+        url = f"{self.BASE_URL}/documents.json"
+        params = {
+            "date": date,
+            "type": "2",  # 2: メタデータのみ
+            "Subscription-Key": self.api_key
+        }
 
-            results = data.get("results", [])
+        cached = self._load_cached_list(date)
+        if cached is not None:
+            return self._filter_documents(cached, doc_type)
 
-            # 有価証券報告書のみフィルタ
-            filtered = [
-                doc for doc in results
-                if doc.get("docTypeCode") == doc_type
-            ]
+        await limiter.wait()
 
-            return filtered
+        try:
+            async with session.get(url, params=params) as response:
+                response.raise_for_status()
+                data = orjson.loads(await response.read())
+            self._save_cached_list(date, data)
+            return self._filter_documents(data, doc_type)
 
         except Exception as e:
-            print(f"書類一覧取得エラー: {e}")
-            return []
+            print(f"書類一覧取得エラー ({date}): {e}")
+            return None
+
+    def _list_cache_path(self, date: str) -> Path:
+        return self.cache_dir / f"list_{date}.json.gz"
+
+    def _load_cached_list(self, date: str) -> Optional[Dict]:
+        """キャッシュ済みの書類一覧レスポンスを読み込む（無効・期限切れはNone）"""
+        cache_path = self._list_cache_path(date)
+        if not cache_path.exists():
+            return None
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        if date >= today and time.time() - cache_path.stat().st_mtime > self.LIST_CACHE_TTL:
+            return None
+
+        try:
+            return orjson.loads(gzip.decompress(cache_path.read_bytes()))
+        except Exception:
+            return None
+
+    def _save_cached_list(self, date: str, data: Dict):
+        """正常な書類一覧レスポンスのみキャッシュに保存"""
+        if data.get("metadata", {}).get("status") != "200":
+            return
+
+        _atomic_write(self._list_cache_path(date), [gzip.compress(orjson.dumps(data))])
+
+    def _filter_documents(self, data: Dict, doc_type: str) -> Optional[List[Dict]]:
+        """書類一覧APIのレスポンスから指定種別の書類を抽出（APIエラー時はNone）"""
+        if data.get("metadata", {}).get("status") != "200":
+            print(f"EDINET API エラー: {data}")
+            return None
+
+        results = data.get("results", [])
+
+        # 有価証券報告書のみフィルタ
+        return [
+            doc for doc in results
+            if doc.get("docTypeCode") == doc_type
+        ]
 
     def search_annual_report(
         self,
@@ -84,6 +378,7 @@ class EDINETClient:
         1. 直近6ヶ月を優先
         2. 決算発表時期（5-6月）を重点的に検索
         3. キャッシュを活用
+        4. 候補日の書類一覧を並行取得
 
         Args:
             edinet_code: EDINETコード (例: "E02144")
@@ -100,17 +395,27 @@ class EDINETClient:
 
         # キャッシュが30日以内なら使用
         if cache_file.exists():
-            import json
             cache_age = (datetime.now() - datetime.fromtimestamp(cache_file.stat().st_mtime)).days
             if cache_age < 30:
                 try:
-                    with open(cache_file, 'r') as f:
-                        cached = json.load(f)
-                        print(f"キャッシュから取得: {edinet_code}")
-                        return cached
+                    cached = orjson.loads(cache_file.read_bytes())
+                    print(f"キャッシュから取得: {edinet_code}")
+                    return cached
                 except:
                     pass
 
+        doc = asyncio.run(
+            self._search_dates_async(edinet_code, self._candidate_dates())
+        )
+
+        if doc:
+            # キャッシュに保存
+            cache_file.write_bytes(orjson.dumps(doc))
+
+        return doc
+
+    def _candidate_dates(self) -> List[str]:
+        """有報の提出日候補を新しい順に列挙"""
         # 優先検索期間（決算発表時期: 5-6月、11-12月）
         priority_months = [5, 6, 11, 12]
 
@@ -118,67 +423,99 @@ class EDINETClient:
         # - 最初の6ヶ月: 全ての日を検索（3日間隔）
         # - 6ヶ月〜2年: 優先月のみ検索（5,6,11,12月、3日間隔）
         # 3日間隔なら約66%の確率で提出日にヒットする
+        dates = []
         for days_ago in range(0, 730, 3):
-            date = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
-            month = int(date.split('-')[1])
+            date = datetime.now() - timedelta(days=days_ago)
 
             # 優先月でない場合はスキップ（最初の6ヶ月は全て検索）
-            if days_ago > 180 and month not in priority_months:
+            if days_ago > 180 and date.month not in priority_months:
                 continue
 
-            docs = self.get_document_list(date=date)
+            dates.append(date.strftime("%Y-%m-%d"))
 
-            for doc in docs:
-                if doc.get("edinetCode") == edinet_code:
-                    # キャッシュに保存
-                    import json
-                    with open(cache_file, 'w') as f:
-                        json.dump(doc, f)
-                    return doc
+        return dates
 
-            # APIレート制限回避（3日間隔なので短めに）
-            time.sleep(0.2)
+    async def _search_dates_async(
+        self,
+        edinet_code: str,
+        dates: List[str]
+    ) -> Optional[Dict]:
+        """
+        候補日の書類一覧を並行取得して有報を検索
+
+        新しい日付から MAX_CONCURRENT_REQUESTS 件ずつまとめて処理し、
+        ヒットしたウィンドウで打ち切る（直近の提出書類を優先する）。
+        インデックス済みの日付はAPIを呼ばずにローカルから検索する。
+        """
+        timeout = aiohttp.ClientTimeout(total=30)
+        today = datetime.now().strftime("%Y-%m-%d")
+        indexed = self.index.indexed_dates(dates)
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            for start in range(0, len(dates), self.MAX_CONCURRENT_REQUESTS):
+                window = dates[start:start + self.MAX_CONCURRENT_REQUESTS]
+                pending = [date for date in window if date not in indexed]
+
+                doc_lists = await asyncio.gather(*[
+                    self._get_document_list_async(session, date, self._limiter)
+                    for date in pending
+                ])
+
+                for date, docs in zip(pending, doc_lists):
+                    if docs is not None:
+                        # 当日分は後から書類が追加されるため確定扱いにしない
+                        self.index.add_documents(date, docs, complete=date < today)
+
+                doc = self.index.find_annual_report(edinet_code, window)
+                if doc:
+                    return doc
 
         return None
 
     def download_document(
         self,
         doc_id: str,
-        output_type: int = 2  # 1: ZIP, 2: PDF
-    ) -> Optional[bytes]:
+        output_type: int = 2,  # 1: ZIP, 2: PDF
+        stream: bool = False
+    ) -> Optional[Union[bytes, BinaryIO]]:
         """
         書類をダウンロード
 
+        レスポンスはチャンク単位でキャッシュファイルに書き出すため、
+        書類全体をメモリに載せることはない
+
         Args:
             doc_id: 書類管理番号
             output_type: 1=ZIP(XBRL), 2=PDF
+            stream: Trueの場合はバイト列ではなくキャッシュファイルを開いて返す
 
         Returns:
-            ファイルのバイナリデータ
+            ファイルのバイナリデータ（stream=Trueの場合はファイルオブジェクト）
         """
         cache_file = self.cache_dir / f"{doc_id}.{'zip' if output_type == 1 else 'pdf'}"
 
-        if cache_file.exists():
-            return cache_file.read_bytes()
+        if not cache_file.exists():
+            url = f"{self.BASE_URL}/documents/{doc_id}"
+            params = {
+                "type": output_type,
+                "Subscription-Key": self.api_key
+            }
 
-        url = f"{self.BASE_URL}/documents/{doc_id}"
-        params = {
-            "type": output_type,
-            "Subscription-Key": self.api_key
-        }
+            try:
+                with self.session.get(url, params=params, timeout=120, stream=True) as response:
+                    response.raise_for_status()
 
-        try:
-            response = requests.get(url, params=params, timeout=120)
-            response.raise_for_status()
+                    # キャッシュに保存
+                    _atomic_write(cache_file, response.iter_content(chunk_size=64 * 1024))
 
-            # キャッシュに保存
-            cache_file.write_bytes(response.content)
+            except Exception as e:
+                print(f"書類ダウンロードエラー: {e}")
+                return None
 
-            return response.content
+        if stream:
+            return open(cache_file, "rb")
 
-        except Exception as e:
-            print(f"書類ダウンロードエラー: {e}")
-            return None
+        return cache_file.read_bytes()
 
     def extract_property_section(self, doc_id: str) -> Optional[str]:
         """
@@ -190,24 +527,31 @@ class EDINETClient:
         Returns:
             セクションのテキスト
         """
-        # ZIPファイルをダウンロード
-        zip_data = self.download_document(doc_id, output_type=1)
-        if not zip_data:
+        # ZIPファイルをダウンロード（メモリに展開せずファイルのまま読む）
+        zip_file = self.download_document(doc_id, output_type=1, stream=True)
+        if not zip_file:
             return None
 
         try:
-            with zipfile.ZipFile(io.BytesIO(zip_data)) as zf:
-                # XBRLファイルを探す
-                xbrl_files = [
-                    f for f in zf.namelist()
-                    if f.endswith('.htm') or f.endswith('.html')
-                ]
+            with zip_file, zipfile.ZipFile(zip_file) as zf:
+                # XBRLファイルを探す（本文・サイズの大きいファイルを優先）
+                # 表紙やヘッダーなどの小さなファイルは設備セクションを含まないので除外
+                xbrl_files = sorted(
+                    (
+                        info for info in zf.infolist()
+                        if (info.filename.endswith('.htm') or info.filename.endswith('.html'))
+                        and info.file_size >= self.MIN_SECTION_FILE_SIZE
+                    ),
+                    key=lambda info: ('honbun' not in info.filename, -info.file_size)
+                )
 
                 # 主要な設備の状況を含むファイルを検索
-                for filename in xbrl_files:
-                    content = zf.read(filename).decode('utf-8', errors='ignore')
+                # （デコード前にバイト列のまま判定し、該当しないファイルはスキップ）
+                for info in xbrl_files:
+                    raw = zf.read(info)
 
-                    if '主要な設備の状況' in content or '設備の状況' in content:
+                    if _PROPERTY_SECTION_MARKER in raw:
+                        content = raw.decode('utf-8', errors='ignore')
                         return self._clean_html(content)
 
             return None
@@ -218,11 +562,24 @@ class EDINETClient:
 
     def _clean_html(self, html: str) -> str:
         """HTMLタグを除去してテキスト化"""
-        # 簡易的なHTMLクリーニング
-        text = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL)
-        text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.DOTALL)
-        text = re.sub(r'<[^>]+>', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
+        try:
+            root = lxml_html.fromstring(html.encode("utf-8"), parser=_HTML_PARSER)
+        except (etree.ParserError, ValueError):
+            root = None
+
+        if root is not None:
+            etree.strip_elements(
+                root, etree.Comment, "script", "style", with_tail=False
+            )
+            # セル同士が連結しないようテキストノードを空白区切りで結合
+            text = " ".join(root.itertext())
+            return _WS_RE.sub(" ", text).strip()
+
+        # lxmlで解析できない断片は正規表現で簡易的にクリーニング
+        text = _SCRIPT_RE.sub('', html)
+        text = _STYLE_RE.sub('', text)
+        text = _TAG_RE.sub(' ', text)
+        text = _WS_RE.sub(' ', text)
         return text.strip()
 
 
@@ -289,6 +646,29 @@ class AnnualReportFetcher:
 
         return result
 
+    def fetch_many(
+        self,
+        companies: List[Tuple[str, str, str]],
+        max_workers: int = 8
+    ) -> List[Dict]:
+        """
+        複数企業の不動産情報をスレッドプールで並行取得
+
+        処理の大半はEDINETとの通信待ちのため、スレッドで並行化できる
+
+        Args:
+            companies: [(証券コード, EDINETコード, 企業名), ...]
+            max_workers: 並行数
+
+        Returns:
+            fetch_property_info の結果のリスト（companies と同じ順序）
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda company: self.fetch_property_info(*company),
+                companies
+            ))
+
 
 def main():
     """テスト実行"""
@@ -3,15 +3,251 @@
 住所から最寄りの基準地価を取得し、時価を推計
 """
 
+import asyncio
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import ijson
+import orjson
 import re
+import sqlite3
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
+import numpy as np
 from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
+from geopy.extra.rate_limiter import RateLimiter
+import threading
 import time
 
+from prefectures import PREFECTURE_CODES, PREFECTURE_RE
+
+
+class HostRateLimiter:
+    """
+    ホスト単位のレートリミッター
+
+    直前のリクエストから最小間隔が空くまで待機する。
+    複数スレッドから共有しても全体で指定レートを超えない。
+    share() でプロセス間の共有状態を渡すと、複数プロセス全体でも指定レートを超えない
+    """
+
+    def __init__(self, requests_per_second: float):
+        self.min_interval = 1.0 / requests_per_second
+        self.last = 0.0
+        self.lock = threading.Lock()
+        # プロセス間で共有するロックと最終リクエスト時刻（Manager のプロキシ）
+        self._shared = None
+
+    def share(self, lock, last):
+        """
+        プロセス間で共有するロックと最終リクエスト時刻を使うようにする
+
+        Args:
+            lock: multiprocessing.Manager().Lock()
+            last: multiprocessing.Manager().Value("d", 0.0)
+        """
+        self._shared = (lock, last)
+
+    def wait(self):
+        with self.lock:
+            if self._shared is None:
+                self.last = self._wait_after(self.last)
+                return
+
+            lock, last = self._shared
+            with lock:
+                last.value = self._wait_after(last.value)
+
+    def _wait_after(self, last: float) -> float:
+        """前回のリクエスト時刻から最小間隔が空くまで待ち、今回の時刻を返す"""
+        elapsed = time.monotonic() - last
+        if elapsed < self.min_interval:
+            time.sleep(self.min_interval - elapsed)
+        return time.monotonic()
+
+
+# 住所の簡略化に使うパターン（末尾の「数字-数字-数字」、「丁目」「番」「号」以降）
+_ADDR_TAIL_RE = re.compile(r'\d+-\d+(-\d+)?$')
+_ADDR_CHOME_RE = re.compile(r'(\d+丁目|\d+番|\d+号).*$')
+
+# 最寄り取引の検索に使う取引データの項目（それ以外は読み捨ててキャッシュにも残さない）
+_TRADE_FIELDS = ("Type", "Municipality", "DistrictName", "TradePrice", "Area", "Use", "Period")
+_LAND_TRADE_TYPE = "宅地(土地)"
+
+# 座標付きの取引一覧: ([(取引, 住所), ...], 緯度の配列, 経度の配列)
+_LocatedTrades = Tuple[List[Tuple[Dict, str]], np.ndarray, np.ndarray]
+
+# 利用規約上の上限（Nominatim: 1リクエスト/秒）に余裕を持たせてホストごとに共有する
+NOMINATIM_RATE_LIMITER = HostRateLimiter(1 / 1.1)
+MLIT_RATE_LIMITER = HostRateLimiter(5.0)
+
+
+# 主要都市の範囲（緯度・経度の下限/上限）。重なる範囲は先頭の行を優先する
+_PREF_LO = np.array([
+    [35.5, 139.4],  # 東京都
+    [35.3, 139.3],  # 神奈川県
+    [34.5, 135.3],  # 大阪府
+    [34.9, 136.7],  # 愛知県
+])
+_PREF_HI = np.array([
+    [35.9, 140.0],
+    [35.7, 139.8],
+    [35.0, 135.8],
+    [35.3, 137.2],
+])
+_PREF_BBOX_CODES = ("13", "14", "27", "23")
+_DEFAULT_PREF_CODE = "13"  # デフォルト: 東京都
+
+
+@lru_cache(maxsize=8192)
+def _pref_from_bin(lat_bin: float, lng_bin: float) -> str:
+    """丸めた座標から都道府県コードを推定（簡易的な判定、主要都市のみ）"""
+    pt = np.array([lat_bin, lng_bin])
+    inside = ((pt >= _PREF_LO) & (pt <= _PREF_HI)).all(axis=1)
+    return _PREF_BBOX_CODES[int(inside.argmax())] if inside.any() else _DEFAULT_PREF_CODE
+
+
+# 主要都道府県の概算平均地価（円/㎡）
+_PREFECTURE_AVERAGES = MappingProxyType({
+    "13": {"name": "東京都", "commercial": 2500000, "residential": 500000},
+    "14": {"name": "神奈川県", "commercial": 800000, "residential": 250000},
+    "27": {"name": "大阪府", "commercial": 1200000, "residential": 200000},
+    "23": {"name": "愛知県", "commercial": 600000, "residential": 150000},
+    "40": {"name": "福岡県", "commercial": 500000, "residential": 100000},
+})
+_DEFAULT_AVERAGE = MappingProxyType({"name": "その他", "commercial": 300000, "residential": 80000})
+
+
+@lru_cache(maxsize=None)
+def _prefecture_average(pref_code: str, year: int) -> Dict:
+    """都道府県の平均地価（同じ引数には同じdictを返すため、呼び出し側で変更しないこと）"""
+    avg = _PREFECTURE_AVERAGES.get(pref_code, _DEFAULT_AVERAGE)
+
+    return {
+        "address": avg["name"],
+        "price_per_sqm": avg["commercial"],  # 商業地を使用
+        "distance_km": None,
+        "survey_year": year,
+        "land_use": "商業地（都道府県平均）",
+        "source": "概算平均値"
+    }
+
+
+def _haversine_km(lat1, lng1, lat2, lng2):
+    """
+    2点間の大円距離（km）
+
+    スカラー・NumPy配列のどちらも受け付ける。楕円体上の測地線距離との差は
+    0.5%程度で、最寄り取引の選択や距離表示には十分な精度
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
+class LandPriceCache:
+    """
+    ジオコーディング結果と国土交通省APIレスポンスの永続キャッシュ（SQLite）
+
+    プロセスをまたいで結果を再利用し、レート制限の厳しいNominatimへの
+    リクエストを住所ごとに一度きりにする
+    """
+
+    # キャッシュの有効期間（秒）
+    TTL = 90 * 24 * 60 * 60
+    # 「見つからなかった」住所の有効期間（秒）。住所表記の補正で解決しうるので短めにする
+    MISS_TTL = 7 * 24 * 60 * 60
+
+    def __init__(self, db_path: Path):
+        # ValueEstimator のワーカースレッドから共有するためロックで直列化
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS geocode (
+                address_normalized TEXT PRIMARY KEY,
+                lat REAL,
+                lng REAL,
+                ts INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS trades (
+                pref_code TEXT,
+                year INTEGER,
+                trades_json TEXT,
+                ts INTEGER,
+                PRIMARY KEY (pref_code, year)
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                count INTEGER
+            );
+        """)
+
+    @staticmethod
+    def normalize_address(address: str) -> str:
+        """全角・半角の揺れを吸収したキャッシュキー"""
+        return unicodedata.normalize("NFKC", address).strip()
+
+    def get_coords(self, address: str) -> Optional[Tuple[float, ...]]:
+        """
+        キャッシュ済みの座標を返す
+
+        未キャッシュならNone、見つからなかったと記録済みなら空タプルを返す
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT lat, lng, ts FROM geocode WHERE address_normalized = ? AND ts >= ?",
+                (self.normalize_address(address), int(time.time()) - self.TTL)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[0] is None:
+            return () if row[2] >= int(time.time()) - self.MISS_TTL else None
+        return (row[0], row[1])
+
+    def set_coords(self, address: str, coords: Optional[Tuple[float, float]]):
+        """座標を保存（Noneなら見つからなかったことを記録）"""
+        lat, lng = coords if coords else (None, None)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                (self.normalize_address(address), lat, lng, int(time.time()))
+            )
+
+    def get_trades(self, pref_code: str, year: int) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT trades_json FROM trades WHERE pref_code = ? AND year = ? AND ts >= ?",
+                (pref_code, year, int(time.time()) - self.TTL)
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def set_trades(self, pref_code: str, year: int, trades: List[Dict]):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO trades VALUES (?, ?, ?, ?)",
+                (pref_code, year, orjson.dumps(trades), int(time.time()))
+            )
+
+    def increment_counter(self, name: str) -> int:
+        """利用回数などのカウンターを1増やし、増やした後の値を返す"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO counters VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET count = count + 1",
+                (name,)
+            )
+            return self.conn.execute(
+                "SELECT count FROM counters WHERE name = ?", (name,)
+            ).fetchone()[0]
+
 
 class LandPriceClient:
     """国土交通省 土地総合情報システムAPI クライアント"""
@@ -26,7 +262,46 @@ class LandPriceClient:
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.geocoder = Nominatim(user_agent="real_estate_analyzer")
-        self._price_cache = {}
+        self.cache = LandPriceCache(self.cache_dir / "cache.db")
+
+        # 実行中に取得した座標付きの取引データ（キー: (都道府県コード, 年)）
+        self._trades_cache: Dict[Tuple[str, int], _LocatedTrades] = {}
+        self._trades_locks: Dict[Tuple[str, int], threading.Lock] = {}
+
+        # 429・タイムアウト時は待ってから再試行する。間隔の制御はホスト共有の
+        # NOMINATIM_RATE_LIMITER に任せ、再試行も含めて全体で1.1秒に1回に抑える
+        self._geocode_rl = RateLimiter(
+            self._throttled_geocode,
+            min_delay_seconds=0,
+            max_retries=3,
+            error_wait_seconds=5.0,
+            # 再試行しても失敗した場合は例外のまま返し、「見つからない」と区別する
+            swallow_exceptions=False
+        )
+
+        # TCP/TLS接続を使い回すためのセッション（Sessionはスレッドセーフでないためスレッドごとに持つ）
+        # 使うのは国土交通省APIの取引一覧の取得だけ（Nominatimはgeopy側の接続を使う）。
+        # 一覧は都道府県・年ごとに1回取得してSQLiteに残すためリクエスト数が少なく、
+        # HTTP/2の多重化ではなくHTTP/1.1のkeep-aliveで足りる
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["Accept-Encoding"] = "gzip"
+            retry = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+            session.mount(
+                "https://",
+                HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+            )
+            self._local.session = session
+        return session
 
     def get_land_price_by_address(
         self,
@@ -57,74 +332,74 @@ class LandPriceClient:
         lat, lng = coords
 
         # 最寄りの地価データを検索
-        price_data = self._search_nearest_price(lat, lng, year)
+        price_data = self._search_nearest_price(lat, lng, year, address=address)
 
         return price_data
 
     def _geocode(self, address: str) -> Optional[Tuple[float, float]]:
         """住所から座標を取得"""
-        cache_key = f"geocode_{address}"
-        if cache_key in self._price_cache:
-            return self._price_cache[cache_key]
+        cached = self.cache.get_coords(address)
+        if cached is not None:
+            return cached or None
 
         try:
             # 日本の住所用に調整
-            location = self.geocoder.geocode(address, country_codes="jp")
+            location = self._geocode_rl(address, country_codes="jp", timeout=10)
 
             if location:
                 result = (location.latitude, location.longitude)
-                self._price_cache[cache_key] = result
+                self.cache.set_coords(address, result)
                 return result
 
             # 住所を簡略化して再試行
             simplified = self._simplify_address(address)
             if simplified != address:
-                location = self.geocoder.geocode(simplified, country_codes="jp")
+                location = self._geocode_rl(simplified, country_codes="jp", timeout=10)
                 if location:
                     result = (location.latitude, location.longitude)
-                    self._price_cache[cache_key] = result
+                    self.cache.set_coords(address, result)
                     return result
 
+            # 見つからなかった住所も記録し、次回以降はリクエストしない
+            self.cache.set_coords(address, None)
             return None
 
         except Exception as e:
             print(f"ジオコーディングエラー ({address}): {e}")
             return None
 
+    def _throttled_geocode(self, query: str, **kwargs):
+        """Nominatimのレート上限を守ってジオコーディング"""
+        NOMINATIM_RATE_LIMITER.wait()
+        return self.geocoder.geocode(query, **kwargs)
+
     def _simplify_address(self, address: str) -> str:
         """住所を簡略化（番地以降を削除）"""
         # 数字-数字-数字 のパターンを削除
-        simplified = re.sub(r'\d+-\d+(-\d+)?$', '', address)
+        simplified = _ADDR_TAIL_RE.sub('', address)
         # 「丁目」「番」「号」以降を削除
-        simplified = re.sub(r'(\d+丁目|\d+番|\d+号).*$', r'\1', simplified)
+        simplified = _ADDR_CHOME_RE.sub(r'\1', simplified)
         return simplified.strip()
 
     def _search_nearest_price(
         self,
         lat: float,
         lng: float,
-        year: int
+        year: int,
+        address: str = ""
     ) -> Optional[Dict]:
         """座標から最寄りの地価データを検索"""
 
-        # 都道府県コードを推定
-        pref_code = self._estimate_prefecture_code(lat, lng)
+        # 都道府県コードを住所から特定（住所に都道府県名がなければ座標から推定）
+        pref_code = (
+            self._prefecture_code_from_address(address)
+            or self._estimate_prefecture_code(lat, lng)
+        )
 
         try:
-            # 国土交通省APIで周辺の取引データを取得
-            params = {
-                "year": year,
-                "area": pref_code,
-                "from": f"{year}1",
-                "to": f"{year}4"
-            }
-
-            response = requests.get(self.API_URL, params=params, timeout=30)
-
-            if response.status_code == 200:
-                data = response.json()
-                trades = data.get("data", [])
+            trades = self._get_trades(pref_code, year)
 
+            if trades is not None:
                 # 最寄りの土地取引を検索
                 nearest = self._find_nearest_trade(trades, lat, lng)
                 if nearest:
@@ -136,56 +411,145 @@ class LandPriceClient:
         # フォールバック: 都道府県平均地価を返す
         return self._get_prefecture_average(pref_code, year)
 
+    def _get_trades(self, pref_code: str, year: int) -> Optional[_LocatedTrades]:
+        """
+        都道府県・年の取引データを座標付きで取得
+
+        同じ都道府県の物件は同じ一覧を使うため、実行中はメモリに保持して
+        SQLiteの読み込みやAPI呼び出し、取引住所のジオコーディングを1回にまとめる
+        """
+        key = (pref_code, year)
+        trades = self._trades_cache.get(key)
+        if trades is not None:
+            return trades
+
+        # 並行実行中の物件が同じ一覧を重複して取得しないようキーごとに直列化
+        with self._trades_locks.setdefault(key, threading.Lock()):
+            trades = self._trades_cache.get(key)
+            if trades is not None:
+                return trades
+
+            trades = self.cache.get_trades(pref_code, year)
+
+            if trades is None:
+                # 国土交通省APIで周辺の取引データを取得
+                params = {
+                    "year": year,
+                    "area": pref_code,
+                    "from": f"{year}1",
+                    "to": f"{year}4"
+                }
+
+                MLIT_RATE_LIMITER.wait()
+                with self.session.get(
+                    self.API_URL, params=params, timeout=30, stream=True
+                ) as response:
+                    if response.status_code != 200:
+                        return None
+
+                    # 一覧全体を展開せず、土地の取引だけを必要な項目に絞りながら読む
+                    response.raw.decode_content = True
+                    trades = [
+                        {field: t[field] for field in _TRADE_FIELDS if field in t}
+                        for t in ijson.items(response.raw, "data.item", use_float=True)
+                        if t.get("Type") == _LAND_TRADE_TYPE
+                    ]
+                self.cache.set_trades(pref_code, year, trades)
+
+            # 取引住所の座標もキーごとのロックの中で一度だけ求め、
+            # 同じ一覧を待っていた物件が同じ住所を重ねて問い合わせないようにする
+            located = self._locate_trades(trades)
+            self._trades_cache[key] = located
+            return located
+
+    def _locate_trades(self, trades: List[Dict]) -> _LocatedTrades:
+        """
+        土地の取引に座標を付ける
+
+        Returns:
+            _LocatedTrades（座標が取れなかった取引は除く）
+        """
+        # 土地のみの取引をフィルタ
+        land_trades = [t for t in trades if t.get("Type") == _LAND_TRADE_TYPE]
+
+        # 住所から座標を取得（簡易）
+        # 同じ地区の取引は同じ座標になるため、住所ごとに一度だけジオコーディングする
+        # 欠けた項目をNoneで保存していた以前のキャッシュも読めるよう、Noneは空文字として扱う
+        trade_addresses = [
+            (t.get("Municipality") or "") + (t.get("DistrictName") or "") for t in land_trades
+        ]
+        coords_by_address = {
+            address: self._geocode(address) for address in dict.fromkeys(trade_addresses)
+        }
+
+        located = []
+        lats = []
+        lngs = []
+        for trade, address in zip(land_trades, trade_addresses):
+            coords = coords_by_address[address]
+            if coords:
+                located.append((trade, address))
+                lats.append(coords[0])
+                lngs.append(coords[1])
+
+        return located, np.array(lats, dtype=float), np.array(lngs, dtype=float)
+
+    def _prefecture_code_from_address(self, address: str) -> Optional[str]:
+        """住所の都道府県名からJIS都道府県コードを取得"""
+        match = PREFECTURE_RE.search(address)
+        return PREFECTURE_CODES[match.group(0)] if match else None
+
     def _estimate_prefecture_code(self, lat: float, lng: float) -> str:
         """座標から都道府県コードを推定"""
-        # 簡易的な判定（主要都市のみ）
-        if 35.5 <= lat <= 35.9 and 139.4 <= lng <= 140.0:
-            return "13"  # 東京都
-        elif 35.3 <= lat <= 35.7 and 139.3 <= lng <= 139.8:
-            return "14"  # 神奈川県
-        elif 34.5 <= lat <= 35.0 and 135.3 <= lng <= 135.8:
-            return "27"  # 大阪府
-        elif 34.9 <= lat <= 35.3 and 136.7 <= lng <= 137.2:
-            return "23"  # 愛知県
-        else:
-            return "13"  # デフォルト: 東京都
+        # 近い物件は同じ結果になるよう約1km単位に丸めてキャッシュを効かせる
+        return _pref_from_bin(round(lat, 2), round(lng, 2))
 
     def _find_nearest_trade(
         self,
-        trades: List[Dict],
+        trades: _LocatedTrades,
         lat: float,
         lng: float
     ) -> Optional[Dict]:
         """最寄りの取引データを検索"""
-        nearest = None
-        min_distance = float('inf')
-
-        for trade in trades:
-            # 土地のみの取引をフィルタ
-            if trade.get("Type") != "宅地(土地)":
-                continue
-
-            # 住所から座標を取得（簡易）
-            trade_address = trade.get("Municipality", "") + trade.get("DistrictName", "")
-            trade_coords = self._geocode(trade_address)
-
-            if trade_coords:
-                distance = geodesic((lat, lng), trade_coords).km
+        nearest = self._find_nearest_trades(trades, lat, lng, k=1)
+        return nearest[0] if nearest else None
 
-                if distance < min_distance:
-                    min_distance = distance
-                    price_per_sqm = self._calculate_price_per_sqm(trade)
-
-                    nearest = {
-                        "address": trade_address,
-                        "price_per_sqm": price_per_sqm,
-                        "distance_km": round(distance, 2),
-                        "survey_year": trade.get("Period", ""),
-                        "land_use": trade.get("Use", "住宅地"),
-                        "source": "国土交通省取引情報"
-                    }
-
-        return nearest
+    def _find_nearest_trades(
+        self,
+        trades: _LocatedTrades,
+        lat: float,
+        lng: float,
+        k: int = 1
+    ) -> List[Dict]:
+        """近い順に最大k件の取引データを検索（trades は _get_trades の座標付き一覧）"""
+        located, lats, lngs = trades
+        if not located:
+            return []
+
+        # 全取引との距離をまとめて計算（座標はメモリ上の配列をそのまま使う）
+        distances = _haversine_km(lat, lng, lats, lngs)
+
+        # 上位k件だけを部分ソートで取り出し、その中を距離順に並べる
+        if k == 1:
+            nearest = [int(np.argmin(distances))]
+        else:
+            k = min(k, len(located))
+            top = np.argpartition(distances, k - 1)[:k]
+            nearest = top[np.argsort(distances[top])].tolist()
+
+        # 結果のdictは返す件数分だけ作る
+        results = []
+        for i in nearest:
+            trade, trade_address = located[i]
+            results.append({
+                "address": trade_address,
+                "price_per_sqm": self._calculate_price_per_sqm(trade),
+                "distance_km": round(float(distances[i]), 2),
+                "survey_year": trade.get("Period") or "",
+                "land_use": trade.get("Use") or "住宅地",
+                "source": "国土交通省取引情報"
+            })
+        return results
 
     def _calculate_price_per_sqm(self, trade: Dict) -> int:
         """取引データから㎡単価を計算"""
@@ -198,34 +562,23 @@ class LandPriceClient:
 
     def _get_prefecture_average(self, pref_code: str, year: int) -> Dict:
         """都道府県の平均地価を返す（フォールバック）"""
-        # 主要都道府県の概算平均地価（円/㎡）
-        averages = {
-            "13": {"name": "東京都", "commercial": 2500000, "residential": 500000},
-            "14": {"name": "神奈川県", "commercial": 800000, "residential": 250000},
-            "27": {"name": "大阪府", "commercial": 1200000, "residential": 200000},
-            "23": {"name": "愛知県", "commercial": 600000, "residential": 150000},
-            "40": {"name": "福岡県", "commercial": 500000, "residential": 100000},
-        }
-
-        avg = averages.get(pref_code, {"name": "その他", "commercial": 300000, "residential": 80000})
-
-        return {
-            "address": avg["name"],
-            "price_per_sqm": avg["commercial"],  # 商業地を使用
-            "distance_km": None,
-            "survey_year": year,
-            "land_use": "商業地（都道府県平均）",
-            "source": "概算平均値"
-        }
+        return _prefecture_average(pref_code, year)
 
 
 class ValueEstimator:
     """不動産の時価推計"""
 
+    # 物件ごとの時価推計を並行実行する数
+    MAX_CONCURRENT_ESTIMATES = 10
+
     def __init__(self):
         self.land_price_client = LandPriceClient()
 
-    def estimate_market_value(self, property_info: Dict) -> Dict:
+    def estimate_market_value(
+        self,
+        property_info: Dict,
+        land_prices: Optional[Dict[str, Optional[Dict]]] = None
+    ) -> Dict:
         """
         不動産の時価を推計
 
@@ -236,6 +589,7 @@ class ValueEstimator:
                 "land_area_sqm": 1000,
                 "book_value_million_yen": 100
             }
+            land_prices: 正規化した住所ごとの取得済み地価（含まれない住所はAPIで取得）
 
         Returns:
             {
@@ -278,7 +632,11 @@ class ValueEstimator:
             return result
 
         # 地価を取得
-        land_price = self.land_price_client.get_land_price_by_address(address)
+        key = LandPriceCache.normalize_address(address)
+        if land_prices is not None and key in land_prices:
+            land_price = land_prices[key]
+        else:
+            land_price = self.land_price_client.get_land_price_by_address(address)
 
         if land_price:
             price_per_sqm = land_price.get("price_per_sqm", 0)
@@ -312,26 +670,51 @@ class ValueEstimator:
                 "properties": [...]
             }
         """
-        evaluated_properties = []
-        total_book = 0
-        total_estimated = 0
-        total_gain = 0
+        return asyncio.run(self.estimate_company_portfolio_async(properties))
 
-        for prop in properties:
-            evaluated = self.estimate_market_value(prop)
-            evaluated_properties.append(evaluated)
-
-            if evaluated.get("book_value_million_yen"):
-                total_book += evaluated["book_value_million_yen"]
-
-            if evaluated.get("estimated_value_million_yen"):
-                total_estimated += evaluated["estimated_value_million_yen"]
+    async def estimate_company_portfolio_async(self, properties: List[Dict]) -> Dict:
+        """
+        estimate_company_portfolio の非同期版
 
-            if evaluated.get("unrealized_gain_million_yen"):
-                total_gain += evaluated["unrealized_gain_million_yen"]
+        住所ごとの地価取得を最大 MAX_CONCURRENT_ESTIMATES 件並行して実行する。
+        各APIへのリクエスト間隔はホスト単位のレートリミッターで制御する
+        """
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_ESTIMATES)
 
-            # APIレート制限対策
-            time.sleep(0.5)
+        # 同じ建物・敷地が複数行に載ることがあるため、地価の取得は住所ごとに1回にする
+        addresses = {}
+        for prop in properties:
+            address = prop.get("address", "")
+            if prop.get("type") != "賃貸" and address and prop.get("land_area_sqm"):
+                addresses.setdefault(LandPriceCache.normalize_address(address), address)
+
+        async def lookup_one(address: str) -> Optional[Dict]:
+            async with semaphore:
+                # HTTP通信は同期クライアントのため、ワーカースレッドで実行する
+                return await asyncio.to_thread(
+                    self.land_price_client.get_land_price_by_address, address
+                )
+
+        land_prices = dict(zip(
+            addresses,
+            await asyncio.gather(*[lookup_one(address) for address in addresses.values()])
+        ))
+
+        # 地価が揃っていれば残りは物件ごとの面積・簿価による計算のみ
+        evaluated_properties = [
+            self.estimate_market_value(prop, land_prices) for prop in properties
+        ]
+
+        # 値のない物件は0として、3列をまとめて集計
+        totals = np.array([
+            [
+                evaluated.get("book_value_million_yen") or 0,
+                evaluated.get("estimated_value_million_yen") or 0,
+                evaluated.get("unrealized_gain_million_yen") or 0
+            ]
+            for evaluated in evaluated_properties
+        ], dtype=np.float64).reshape(-1, 3).sum(axis=0)
+        total_book, total_estimated, total_gain = totals.tolist()
 
         return {
             "total_book_value_million_yen": round(total_book, 0),
@@ -6,19 +6,24 @@ TOPIX500企業の有価証券報告書から不動産情報を抽出し、
 """
 
 import argparse
-import json
+import asyncio
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import Manager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
+import numpy as np
+import orjson
 from tqdm import tqdm
+from tqdm.asyncio import tqdm as atqdm
 from dotenv import load_dotenv
 
 from topix500 import TOPIX500Fetcher
 from edinet_api import AnnualReportFetcher
 from claude_parser import PropertyExtractor, PropertyAnalyzer
-from land_price import ValueEstimator
+from land_price import MLIT_RATE_LIMITER, NOMINATIM_RATE_LIMITER, ValueEstimator
 from map_generator import MapGenerator
 
 
@@ -26,9 +31,72 @@ from map_generator import MapGenerator
 load_dotenv()
 
 
+RESULTS_FILE_NAME = "analysis_results.json"
+RESULTS_LOG_NAME = "analysis_results.jsonl"
+
+
+def load_results(output_dir: Path) -> List[Dict]:
+    """
+    解析結果を読み込む（同じ銘柄は後の行を優先）
+
+    追記ログがなく旧形式のJSONだけがある場合は、
+    それを追記ログに移してから読み込む
+    """
+    results_file = output_dir / RESULTS_FILE_NAME
+    results_log = output_dir / RESULTS_LOG_NAME
+
+    if not results_log.exists():
+        if not results_file.exists():
+            return []
+        with open(results_file, "rb") as f:
+            legacy = orjson.loads(f.read())
+        with open(results_log, "wb") as f:
+            f.writelines(orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE) for r in legacy)
+        return legacy
+
+    results = {}
+    with open(results_log, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                r = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # 書き込み途中で中断された末尾行は無視
+                continue
+            results[r["stock_code"]] = r
+    return list(results.values())
+
+
+def append_result(output_dir: Path, result: Dict):
+    """解析結果を追記ログに1行で書き足す（異常終了しても書いた行は残るようfsyncする）"""
+    with open(output_dir / RESULTS_LOG_NAME, "ab") as f:
+        f.write(orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def consolidate_results(output_dir: Path) -> List[Dict]:
+    """追記ログを analysis_results.json にまとめて書き出す"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results = load_results(output_dir)
+
+    # 書き込み途中のファイルを読まれないよう一時ファイルから置き換える
+    results_file = output_dir / RESULTS_FILE_NAME
+    tmp_file = results_file.with_suffix(".json.tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_file, results_file)
+    return results
+
+
 class RealEstateAnalyzer:
     """不動産含み益解析のメインクラス"""
 
+    # 企業単位で並行して解析するスレッド数（環境変数 MAX_WORKERS で上書き可）
+    DEFAULT_MAX_WORKERS = 8
+
     def __init__(
         self,
         anthropic_api_key: Optional[str] = None,
@@ -39,6 +107,7 @@ class RealEstateAnalyzer:
         self.edinet_api_key = edinet_api_key or os.environ.get("EDINET_API_KEY")
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = int(os.environ.get("MAX_WORKERS", self.DEFAULT_MAX_WORKERS))
 
         # 各モジュールの初期化
         self.topix_fetcher = TOPIX500Fetcher()
@@ -157,7 +226,8 @@ class RealEstateAnalyzer:
     def analyze_topix500(
         self,
         limit: Optional[int] = None,
-        skip_existing: bool = True
+        skip_existing: bool = True,
+        workers: Optional[int] = None
     ) -> List[Dict]:
         """
         TOPIX500全企業を解析
@@ -165,6 +235,7 @@ class RealEstateAnalyzer:
         Args:
             limit: 解析する企業数の上限（テスト用）
             skip_existing: 既存の解析結果をスキップするか
+            workers: 並列プロセス数。Noneの場合はスレッドで並行実行
 
         Returns:
             解析結果のリスト
@@ -181,50 +252,94 @@ class RealEstateAnalyzer:
 
         print(f"対象銘柄数: {len(stocks)}")
 
-        results = []
-        results_file = self.output_dir / "analysis_results.json"
-
-        # 既存結果を読み込み
+        # 既存結果を読み込み（再解析時は追記ログを作り直す）
         existing_results = {}
-        if skip_existing and results_file.exists():
-            with open(results_file, "r", encoding="utf-8") as f:
-                existing = json.load(f)
-                existing_results = {r["stock_code"]: r for r in existing}
+        if skip_existing:
+            existing_results = {r["stock_code"]: r for r in load_results(self.output_dir)}
             print(f"既存の解析結果: {len(existing_results)}件")
+        else:
+            (self.output_dir / RESULTS_LOG_NAME).unlink(missing_ok=True)
+
+        results_by_code = {}
+
+        def record(result: Dict):
+            # 中間結果を1行だけ追記（完了した企業から順に）
+            results_by_code[result["stock_code"]] = result
+            append_result(self.output_dir, result)
 
-        for stock in tqdm(stocks, desc="解析中"):
+        jobs = []
+        for stock in stocks:
             stock_code = stock["code"]
             company_name = stock["name"]
 
             # 既存結果をスキップ
             if skip_existing and stock_code in existing_results:
-                results.append(existing_results[stock_code])
+                results_by_code[stock_code] = existing_results[stock_code]
                 continue
 
             # EDINETコードを取得
             edinet_code = stock.get("edinet_code") or edinet_mapping.get(stock_code)
 
             if not edinet_code:
-                results.append({
+                record({
                     "stock_code": stock_code,
                     "company_name": company_name,
                     "error": "EDINETコードが見つかりません"
                 })
                 continue
 
-            # 解析実行
-            result = self.analyze_single_company(stock_code, company_name, edinet_code)
-            results.append(result)
-
-            # 中間結果を保存
-            with open(results_file, "w", encoding="utf-8") as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
+            jobs.append((stock_code, company_name, edinet_code))
+
+        if workers:
+            # CPU処理（応答の解析・集計）も並列化するため企業単位でプロセスに分ける。
+            # 結果の追記はこのプロセスでまとめて行う
+            # レート制限の状態はプロセス間で共有し、プロセス数によらずホストごとの上限を守る
+            with Manager() as manager, ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_worker,
+                initargs=(str(self.output_dir), create_shared_rate_limits(manager))
+            ) as executor:
+                results_iter = executor.map(analyze_in_worker, jobs, chunksize=4)
+                for result in tqdm(results_iter, total=len(jobs), desc="解析中"):
+                    record(result)
+        else:
+            # 解析実行（待ち時間の大半はI/Oなので企業単位で並行させる）
+            asyncio.run(self._analyze_jobs_async(jobs, record))
+
+        # 銘柄リストの順に並べ直す
+        results = [results_by_code[s["code"]] for s in stocks if s["code"] in results_by_code]
+
+        # 追記ログを1つのJSONにまとめる
+        consolidate_results(self.output_dir)
 
         # サマリーを出力
         self._print_summary(results)
 
         return results
 
+    async def _analyze_jobs_async(
+        self,
+        jobs: List[Tuple[str, str, str]],
+        on_result: Callable[[Dict], None]
+    ):
+        """
+        企業ごとの解析を最大 max_workers 社並行して実行し、完了順に on_result へ渡す
+        """
+        # to_thread の既定スレッド数はCPU数依存のため、並行数に合わせる
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=self.max_workers)
+        )
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def analyze_one(job: Tuple[str, str, str]) -> Dict:
+            async with semaphore:
+                # 各モジュールは同期APIのため、ワーカースレッドで実行する
+                return await asyncio.to_thread(self.analyze_single_company, *job)
+
+        tasks = [analyze_one(job) for job in jobs]
+        for next_done in atqdm.as_completed(tasks, total=len(tasks), desc="解析中"):
+            on_result(await next_done)
+
     def _print_summary(self, results: List[Dict]):
         """解析結果のサマリーを出力"""
         print("\n" + "="*60)
@@ -234,9 +349,14 @@ class RealEstateAnalyzer:
         successful = [r for r in results if not r.get("error")]
         failed = [r for r in results if r.get("error")]
 
-        total_book = sum(r.get("total_book_value_million_yen", 0) or 0 for r in successful)
-        total_estimated = sum(r.get("total_estimated_value_million_yen", 0) or 0 for r in successful)
-        total_gain = sum(r.get("total_unrealized_gain_million_yen", 0) or 0 for r in successful)
+        total_book, total_estimated, total_gain = np.array([
+            [
+                r.get("total_book_value_million_yen", 0) or 0,
+                r.get("total_estimated_value_million_yen", 0) or 0,
+                r.get("total_unrealized_gain_million_yen", 0) or 0
+            ]
+            for r in successful
+        ], dtype=np.float64).reshape(-1, 3).sum(axis=0).tolist()
 
         print(f"解析成功: {len(successful)}社")
         print(f"解析失敗: {len(failed)}社")
@@ -284,6 +404,37 @@ class RealEstateAnalyzer:
         return str(output_path)
 
 
+# プロセス並列時に各ワーカープロセスが持つ解析器
+_worker_analyzer: Optional[RealEstateAnalyzer] = None
+
+
+def create_shared_rate_limits(manager) -> Dict[str, Tuple]:
+    """
+    ワーカープロセス間で共有するレート制限の状態を作成
+
+    Returns:
+        {"nominatim": (ロック, 最終リクエスト時刻), "mlit": ..., "edinet": (ロック, 次の発行可能時刻)}
+    """
+    return {
+        host: (manager.Lock(), manager.Value("d", 0.0))
+        for host in ("nominatim", "mlit", "edinet")
+    }
+
+
+def init_worker(output_dir: str, rate_limits: Dict[str, Tuple]):
+    """ワーカープロセスの初期化（APIクライアント等はプロセスごとに生成し、レート制限だけ共有）"""
+    global _worker_analyzer
+    NOMINATIM_RATE_LIMITER.share(*rate_limits["nominatim"])
+    MLIT_RATE_LIMITER.share(*rate_limits["mlit"])
+    _worker_analyzer = RealEstateAnalyzer(output_dir=output_dir)
+    _worker_analyzer.report_fetcher.client.share_rate_limit(*rate_limits["edinet"])
+
+
+def analyze_in_worker(job: Tuple[str, str, str]) -> Dict:
+    """ワーカープロセスで1社を解析"""
+    return _worker_analyzer.analyze_single_company(*job)
+
+
 def main():
     """CLI エントリーポイント"""
     parser = argparse.ArgumentParser(
@@ -322,8 +473,27 @@ def main():
         help="既存の解析結果を無視して再解析"
     )
 
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=None,
+        help="--all 時の並列プロセス数（未指定時はスレッドで並行実行）"
+    )
+
+    parser.add_argument(
+        "--consolidate",
+        action="store_true",
+        help="追記ログ(analysis_results.jsonl)をanalysis_results.jsonにまとめる"
+    )
+
     args = parser.parse_args()
 
+    if args.consolidate:
+        # APIを使わないのでキー確認より前に処理
+        results = consolidate_results(Path(args.output))
+        print(f"{len(results)}件を {args.output}/{RESULTS_FILE_NAME} にまとめました")
+        return
+
     # API キー確認
     if not os.environ.get("ANTHROPIC_API_KEY"):
         print("エラー: ANTHROPIC_API_KEY 環境変数を設定してください")
@@ -355,8 +525,8 @@ def main():
 
         # 結果を保存
         output_file = Path(args.output) / f"{stock_code}_result.json"
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        with open(output_file, "wb") as f:
+            f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
 
         print(f"\n結果を保存しました: {output_file}")
 
@@ -367,7 +537,8 @@ def main():
         # TOPIX500全企業を解析
         results = analyzer.analyze_topix500(
             limit=args.limit,
-            skip_existing=not args.no_cache
+            skip_existing=not args.no_cache,
+            workers=args.workers
         )
 
         print(f"\n解析結果: {args.output}/analysis_results.json")
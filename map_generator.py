@@ -3,21 +3,333 @@
 Foliumを使用してインタラクティブな地図を生成
 """
 
+import gzip
+import html
 import json
+import os
+import shutil
+from operator import itemgetter
 import folium
+import numpy as np
 from folium import plugins
 from typing import List, Dict, Optional
 from pathlib import Path
-from geopy.geocoders import Nominatim
-import time
+from geopy.geocoders import GoogleV3, Nominatim
+from geopy.extra.rate_limiter import RateLimiter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from string import Template
+import jinja2
+
+from land_price import NOMINATIM_RATE_LIMITER, LandPriceCache
+
+
+# マーカーのポップアップ。{key} を物件ごとの値に置き換えてブラウザ側で生成する
+_POPUP_TEMPLATE = """
+<div style="font-family: 'Helvetica Neue', sans-serif; min-width: 250px;">
+    <h4 style="margin: 0 0 10px 0; color: #1F2937;">{name}</h4>
+    <table style="width: 100%; border-collapse: collapse;">
+        <tr>
+            <td style="padding: 4px 0; color: #6B7280;">所有形態</td>
+            <td style="padding: 4px 0; text-align: right;">{type}</td>
+        </tr>
+        <tr>
+            <td style="padding: 4px 0; color: #6B7280;">住所</td>
+            <td style="padding: 4px 0; text-align: right; font-size: 12px;">{address}</td>
+        </tr>
+        <tr>
+            <td style="padding: 4px 0; color: #6B7280;">土地面積</td>
+            <td style="padding: 4px 0; text-align: right;">{land_area}</td>
+        </tr>
+        <tr style="border-top: 1px solid #E5E7EB;">
+            <td style="padding: 8px 0 4px 0; color: #6B7280;">帳簿価額</td>
+            <td style="padding: 8px 0 4px 0; text-align: right;">¥{book_value}m</td>
+        </tr>
+        <tr>
+            <td style="padding: 4px 0; color: #6B7280;">時価推計</td>
+            <td style="padding: 4px 0; text-align: right;">¥{estimated_value}m</td>
+        </tr>
+        <tr style="background: {gain_bg};">
+            <td style="padding: 4px 8px; font-weight: bold;">含み益</td>
+            <td style="padding: 4px 8px; text-align: right; font-weight: bold; color: {gain_color};">
+                {gain}
+            </td>
+        </tr>
+    </table>
+    <p style="margin: 10px 0 0 0; font-size: 11px; color: #9CA3AF;">
+        {notes}
+    </p>
+</div>
+"""
+
+
+# タイトル・凡例・サイドバーのHTML（呼び出しごとに組み立てず、差し込みだけ行う）
+_TITLE_TEMPLATE = Template("""
+        <div style="
+            position: fixed;
+            top: 10px;
+            left: 60px;
+            z-index: 1000;
+            background: white;
+            padding: 15px 20px;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            font-family: 'Helvetica Neue', sans-serif;
+        ">
+            <h2 style="margin: 0 0 5px 0; font-size: 18px; color: #1F2937;">
+                $company_name 不動産含み益解析
+            </h2>
+            <p style="margin: 0 0 10px 0; font-size: 12px; color: #6B7280;">
+                有価証券報告書 簿価 vs 公示地価・基準地価
+            </p>
+            <div style="display: flex; gap: 20px;">
+                <div>
+                    <div style="font-size: 11px; color: #6B7280;">保有土地簿価計</div>
+                    <div style="font-size: 16px; font-weight: bold;">¥$total_book 百万円</div>
+                </div>
+                <div>
+                    <div style="font-size: 11px; color: #6B7280;">含み益合計</div>
+                    <div style="font-size: 16px; font-weight: bold; color: #10B981;">
+                        +¥$total_gain 百万円
+                    </div>
+                </div>
+            </div>
+        </div>
+        """)
+
+_LEGEND_HTML = """
+        <div style="
+            position: fixed;
+            bottom: 30px;
+            right: 10px;
+            z-index: 1000;
+            background: white;
+            padding: 10px 15px;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            font-family: 'Helvetica Neue', sans-serif;
+            font-size: 12px;
+        ">
+            <div style="font-weight: bold; margin-bottom: 8px;">凡例 (Ownership)</div>
+            <div style="display: flex; align-items: center; margin-bottom: 4px;">
+                <span style="display: inline-block; width: 12px; height: 12px; background: #10B981; border-radius: 50%; margin-right: 8px;"></span>
+                自社保有 (Owned)
+            </div>
+            <div style="display: flex; align-items: center;">
+                <span style="display: inline-block; width: 12px; height: 12px; background: #9CA3AF; border-radius: 50%; margin-right: 8px;"></span>
+                賃貸 (Leased)
+            </div>
+        </div>
+        """
+
+_SIDEBAR_TEMPLATE = Template("""
+        <div id="sidebar" style="
+            position: fixed;
+            top: 10px;
+            left: 10px;
+            width: 280px;
+            max-height: calc(100vh - 20px);
+            z-index: 999;
+            background: white;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            font-family: 'Helvetica Neue', sans-serif;
+            display: none;
+        ">
+            <div style="
+                padding: 15px;
+                border-bottom: 1px solid #E5E7EB;
+                display: flex;
+                justify-content: space-between;
+                align-items: center;
+            ">
+                <span style="font-weight: bold;">物件一覧</span>
+                <button onclick="document.getElementById('sidebar').style.display='none'" style="
+                    background: none;
+                    border: none;
+                    font-size: 18px;
+                    cursor: pointer;
+                    color: #6B7280;
+                ">×</button>
+            </div>
+            <div style="overflow-y: auto; max-height: calc(100vh - 80px);">
+                $items_html
+            </div>
+        </div>
+
+        <button onclick="
+            var sb = document.getElementById('sidebar');
+            sb.style.display = sb.style.display === 'none' ? 'block' : 'none';
+        " style="
+            position: fixed;
+            top: 120px;
+            left: 60px;
+            z-index: 1000;
+            background: white;
+            border: none;
+            padding: 8px 12px;
+            border-radius: 4px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            cursor: pointer;
+            font-family: 'Helvetica Neue', sans-serif;
+            font-size: 13px;
+        ">
+            📋 物件一覧
+        </button>
+        """)
+
+_SIDEBAR_ITEM_TEMPLATE = Template("""
+            <div style="
+                padding: 12px;
+                border-bottom: 1px solid #E5E7EB;
+                cursor: pointer;
+            " onmouseover="this.style.background='#F9FAFB'" onmouseout="this.style.background='white'">
+                <div style="font-weight: 500; margin-bottom: 4px;">$name</div>
+                <div style="font-size: 11px; color: #6B7280; margin-bottom: 4px;">
+                    $address...
+                </div>
+                <div style="display: flex; justify-content: space-between;">
+                    <span style="color: #6B7280;">簿価: ¥${book_value}m</span>
+                    <span style="color: $gain_color; font-weight: bold;">
+                        $gain
+                    </span>
+                </div>
+            </div>
+            """)
+
+
+def _script_json(value) -> str:
+    """<script> 内に埋め込むJSON（</script> で途切れないよう < をエスケープ）"""
+    return json.dumps(value, ensure_ascii=False).replace("<", "\\u003c")
+
+
+class _PropertyMarkers(folium.MacroElement):
+    """
+    物件マーカーをまとめて描画するレイヤー
+
+    物件データはJSON配列1つとして埋め込み、ポップアップHTMLは
+    クリックされたときに共通テンプレートから生成する
+    """
+
+    _template = jinja2.Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var props = {{ this.props_json }};
+            var popupTemplate = {{ this.popup_template_json }};
+            function renderPopup(p) {
+                return popupTemplate.replace(/\\{(\\w+)\\}/g, function(_, key) {
+                    return p[key] == null ? "" : p[key];
+                });
+            }
+            props.forEach(function(p) {
+                var marker = L.circleMarker([p.lat, p.lng], {
+                    radius: p.radius,
+                    color: p.color,
+                    fill: true,
+                    fillColor: p.color,
+                    fillOpacity: 0.7
+                });
+                marker.bindPopup(function() { return renderPopup(p); }, {maxWidth: 300});
+                marker.bindTooltip(p.tooltip);
+                {{ this.parent_name }}.addLayer(marker);
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, parent: folium.MacroElement, markers: List[Dict]):
+        super().__init__()
+        self._name = "PropertyMarkers"
+        self.parent_name = parent.get_name()
+        self.props_json = _script_json(markers)
+        self.popup_template_json = _script_json(_POPUP_TEMPLATE)
+
+
+class _CoordCache:
+    """
+    住所 → 座標 の辞書風キャッシュ
+
+    プロセス内の辞書の裏にSQLiteの永続キャッシュを置き、実行や
+    プロセスをまたいで結果を共有する。見つからなかった住所の値は None。
+    地図側の「見つからない」はプロセス内だけに留める（地価推計側は住所を
+    簡略化して再検索するため、永続化すると共有キャッシュでその再検索を妨げる）。
+    Googleの結果も remember() でプロセス内だけに置く（利用規約上の保存期間が
+    永続キャッシュの期限より短く、地価推計側にも流用させないため）
+    """
+
+    def __init__(self, store: LandPriceCache):
+        self._store = store
+        self._memory: Dict[str, Optional[tuple]] = {}
+
+    def __contains__(self, address: str) -> bool:
+        if address in self._memory:
+            return True
+        cached = self._store.get_coords(address)
+        if cached is None:
+            return False
+        self._memory[address] = cached or None
+        return True
+
+    def __getitem__(self, address: str) -> Optional[tuple]:
+        if address not in self:
+            raise KeyError(address)
+        return self._memory[address]
+
+    def __setitem__(self, address: str, coords: Optional[tuple]):
+        self._memory[address] = coords
+        if coords is not None:
+            self._store.set_coords(address, coords)
+
+    def remember(self, address: str, coords: Optional[tuple]):
+        """永続キャッシュには書かず、プロセス内だけに記録する"""
+        self._memory[address] = coords
 
 
 class MapGenerator:
     """不動産含み益マップ生成"""
 
-    def __init__(self):
+    # ジオコーディングを並行させるスレッド数（リクエスト間隔は NOMINATIM_RATE_LIMITER が制御）
+    GEOCODE_WORKERS = 4
+
+    # Google Geocoding APIを使う月間の上限件数（超えた分はNominatimで処理）
+    GOOGLE_MONTHLY_QUOTA = 40_000
+
+    # 背景地図の既定値（CartoDB Positron のCDN）
+    DEFAULT_TILES = "cartodbpositron"
+
+    def __init__(
+        self,
+        cache_dir: str = "./cache/land_price",
+        google_api_key: Optional[str] = None
+    ):
         self.geocoder = Nominatim(user_agent="real_estate_analyzer")
-        self._coord_cache = {}
+
+        # APIキーがあれば精度の高いGoogleを優先し、Nominatimは予備にする
+        google_api_key = google_api_key or os.environ.get("GOOGLE_MAPS_API_KEY")
+        self.google_geocoder = GoogleV3(api_key=google_api_key) if google_api_key else None
+
+        # 社内のタイルサーバーを指定すると、地図を開くたびのCDNへのタイル取得を避けられる
+        # 例: MAP_TILES_URL=http://tiles.internal:8080/styles/positron/{z}/{x}/{y}.png
+        self.tiles = os.environ.get("MAP_TILES_URL") or self.DEFAULT_TILES
+        self.tiles_attr = (
+            os.environ.get("MAP_TILES_ATTR") or "© CARTO © OpenStreetMap contributors"
+            if self.tiles != self.DEFAULT_TILES else None
+        )
+
+        # 地価推計と同じ永続キャッシュを使い、実行をまたいで座標を再利用する
+        cache_path = Path(cache_dir)
+        cache_path.mkdir(parents=True, exist_ok=True)
+        self.cache = LandPriceCache(cache_path / "cache.db")
+        self._coord_cache = _CoordCache(self.cache)
+
+        # 429・タイムアウト時は待ってから再試行する
+        self._geocode_rl = RateLimiter(
+            self._throttled_geocode,
+            min_delay_seconds=0,
+            max_retries=2,
+            error_wait_seconds=5.0,
+            swallow_exceptions=False
+        )
 
     def generate_company_map(
         self,
@@ -48,24 +360,39 @@ class MapGenerator:
             return self._generate_empty_map(company_name, output_path)
 
         # 中心座標を計算
-        center_lat = sum(p["lat"] for p in located_properties) / len(located_properties)
-        center_lng = sum(p["lng"] for p in located_properties) / len(located_properties)
+        lat_sum = lng_sum = 0.0
+        for p in located_properties:
+            lat_sum += p["lat"]
+            lng_sum += p["lng"]
+        center_lat = lat_sum / len(located_properties)
+        center_lng = lng_sum / len(located_properties)
 
         # 地図作成
         m = folium.Map(
             location=[center_lat, center_lng],
             zoom_start=10,
-            tiles="cartodbpositron"
+            tiles=self.tiles,
+            attr=self.tiles_attr,
+            # マーカーをSVG要素ではなくCanvasに描画し、物件数が多くても操作を軽くする
+            prefer_canvas=True
         )
 
-        # サマリー計算
-        total_book = sum(p.get("book_value_million_yen", 0) or 0 for p in properties)
-        total_estimated = sum(p.get("estimated_value_million_yen", 0) or 0 for p in properties)
-        total_gain = sum(p.get("unrealized_gain_million_yen", 0) or 0 for p in properties)
+        # サマリー計算（3項目を1回の走査で集計）
+        total_book = total_estimated = total_gain = 0
+        for p in properties:
+            total_book += self._as_number(p.get("book_value_million_yen")) or 0
+            total_estimated += self._as_number(p.get("estimated_value_million_yen")) or 0
+            total_gain += self._as_number(p.get("unrealized_gain_million_yen")) or 0
 
-        # マーカー追加
-        for prop in located_properties:
-            self._add_property_marker(m, prop)
+        # マーカー追加（近接する物件は縮尺に応じてクラスタにまとめる）
+        cluster = plugins.MarkerCluster(
+            options={"showCoverageOnHover": False, "disableClusteringAtZoom": 14}
+        ).add_to(m)
+        colors, radii = self._marker_styles(located_properties)
+        _PropertyMarkers(cluster, [
+            self._property_marker_data(prop, color, radius)
+            for prop, color, radius in zip(located_properties, colors.tolist(), radii.tolist())
+        ]).add_to(m)
 
         # タイトルとサマリーを追加
         title_html = self._generate_title_html(
@@ -82,28 +409,44 @@ class MapGenerator:
         m.get_root().html.add_child(folium.Element(sidebar_html))
 
         # 保存
-        m.save(output_path)
+        self._save_map(m, output_path)
 
         return output_path
 
+    def _save_map(self, m: folium.Map, output_path: str):
+        """
+        地図HTMLを保存し、静的ホスティングでそのまま配信できるgzip版（.html.gz）も書き出す
+        """
+        m.save(output_path)
+        with open(output_path, "rb") as src, \
+                gzip.GzipFile(output_path + ".gz", "wb", compresslevel=9, mtime=0) as dst:
+            shutil.copyfileobj(src, dst)
+
     def _add_coordinates(self, properties: List[Dict]) -> List[Dict]:
         """物件に座標を追加"""
         result = []
 
-        for prop in properties:
-            address = prop.get("address", "")
+        # 全角・半角や前後の空白だけが違う住所もまとめ、空欄の住所は問い合わせない
+        keys = [
+            LandPriceCache.normalize_address(prop.get("address") or "") for prop in properties
+        ]
+
+        # 同じ住所は1回だけ問い合わせ、待ち時間を重ねるため並行して実行
+        addresses = list(dict.fromkeys(key for key in keys if key))
+        with ThreadPoolExecutor(max_workers=self.GEOCODE_WORKERS) as executor:
+            coords_by_address = dict(zip(addresses, executor.map(self._geocode, addresses)))
+
+        for prop, address in zip(properties, keys):
             if not address:
                 continue
 
-            coords = self._geocode(address)
+            coords = coords_by_address[address]
             if coords:
                 prop_with_coords = prop.copy()
                 prop_with_coords["lat"] = coords[0]
                 prop_with_coords["lng"] = coords[1]
                 result.append(prop_with_coords)
 
-            time.sleep(0.5)  # レート制限対策
-
         return result
 
     def _geocode(self, address: str) -> Optional[tuple]:
@@ -111,87 +454,108 @@ class MapGenerator:
         if address in self._coord_cache:
             return self._coord_cache[address]
 
+        if self._google_quota_available():
+            try:
+                location = self.google_geocoder.geocode(
+                    address, region="jp", language="ja", timeout=10
+                )
+                if location:
+                    return self._store_coords(address, location, persist=False)
+            except Exception as e:
+                print(f"Googleジオコーディングエラー ({address}): {e}")
+
         try:
-            location = self.geocoder.geocode(address, country_codes="jp")
+            location = self._geocode_rl(address, country_codes="jp", timeout=10)
             if location:
-                result = (location.latitude, location.longitude)
-                self._coord_cache[address] = result
-                return result
+                return self._store_coords(address, location)
         except Exception:
-            pass
+            # 一時的なエラーは「見つからない」として記録しない
+            return None
 
+        self._coord_cache[address] = None
         return None
 
-    def _add_property_marker(self, m: folium.Map, prop: Dict):
-        """物件マーカーを追加"""
-        gain = prop.get("unrealized_gain_million_yen", 0) or 0
-        prop_type = prop.get("type", "不明")
-
-        # 含み益に応じた色
-        if gain > 500:
-            color = "#10B981"  # 緑（大きな含み益）
-        elif gain > 100:
-            color = "#3B82F6"  # 青（中程度の含み益）
-        elif gain > 0:
-            color = "#6366F1"  # 紫（小さな含み益）
+    def _store_coords(self, address: str, location, persist: bool = True) -> tuple:
+        """ジオコーディング結果をキャッシュして座標を返す（persist=False はプロセス内のみ）"""
+        result = (location.latitude, location.longitude)
+        if persist:
+            self._coord_cache[address] = result
         else:
-            color = "#6B7280"  # グレー（含み損または不明）
-
-        # 賃貸は別色
-        if prop_type == "賃貸":
-            color = "#9CA3AF"  # 薄いグレー
-
-        # ポップアップ内容
-        popup_html = f"""
-        <div style="font-family: 'Helvetica Neue', sans-serif; min-width: 250px;">
-            <h4 style="margin: 0 0 10px 0; color: #1F2937;">{prop.get('name', '不明')}</h4>
-            <table style="width: 100%; border-collapse: collapse;">
-                <tr>
-                    <td style="padding: 4px 0; color: #6B7280;">所有形態</td>
-                    <td style="padding: 4px 0; text-align: right;">{prop_type}</td>
-                </tr>
-                <tr>
-                    <td style="padding: 4px 0; color: #6B7280;">住所</td>
-                    <td style="padding: 4px 0; text-align: right; font-size: 12px;">{prop.get('address', '不明')}</td>
-                </tr>
-                <tr>
-                    <td style="padding: 4px 0; color: #6B7280;">土地面積</td>
-                    <td style="padding: 4px 0; text-align: right;">{prop.get('land_area_sqm', 'N/A'):,.0f} ㎡</td>
-                </tr>
-                <tr style="border-top: 1px solid #E5E7EB;">
-                    <td style="padding: 8px 0 4px 0; color: #6B7280;">帳簿価額</td>
-                    <td style="padding: 8px 0 4px 0; text-align: right;">¥{prop.get('book_value_million_yen', 0) or 0:,.0f}m</td>
-                </tr>
-                <tr>
-                    <td style="padding: 4px 0; color: #6B7280;">時価推計</td>
-                    <td style="padding: 4px 0; text-align: right;">¥{prop.get('estimated_value_million_yen', 0) or 0:,.0f}m</td>
-                </tr>
-                <tr style="background: {'#D1FAE5' if gain > 0 else '#FEE2E2'};">
-                    <td style="padding: 4px 8px; font-weight: bold;">含み益</td>
-                    <td style="padding: 4px 8px; text-align: right; font-weight: bold; color: {'#059669' if gain > 0 else '#DC2626'};">
-                        {'+' if gain > 0 else ''}¥{gain:,.0f}m
-                    </td>
-                </tr>
-            </table>
-            <p style="margin: 10px 0 0 0; font-size: 11px; color: #9CA3AF;">
-                {prop.get('estimation_notes', '')}
-            </p>
-        </div>
-        """
+            self._coord_cache.remember(address, result)
+        return result
+
+    def _google_quota_available(self) -> bool:
+        """今月のGoogle Geocoding APIの利用枠が残っていれば1件分消費する"""
+        if self.google_geocoder is None:
+            return False
+        month_key = f"google_geocode:{datetime.now():%Y-%m}"
+        return self.cache.increment_counter(month_key) <= self.GOOGLE_MONTHLY_QUOTA
+
+    def _throttled_geocode(self, query: str, **kwargs):
+        """Nominatimのレート上限を守ってジオコーディング"""
+        # レート制限は実際にリクエストするときだけ（地価推計側とホスト単位で共有）
+        NOMINATIM_RATE_LIMITER.wait()
+        return self.geocoder.geocode(query, **kwargs)
+
+    def _marker_styles(self, properties: List[Dict]) -> tuple:
+        """全物件のマーカー色と半径を配列でまとめて決める"""
+        gains = np.array(
+            [self._as_number(p.get("unrealized_gain_million_yen")) or 0 for p in properties],
+            dtype=float
+        )
+        types = np.array([p.get("type", "不明") for p in properties], dtype=object)
+
+        # 含み益に応じた色（緑: 大きな含み益 / 青: 中程度 / 紫: 小さな含み益 / グレー: 含み損または不明）
+        colors = np.select(
+            [gains > 500, gains > 100, gains > 0],
+            ["#10B981", "#3B82F6", "#6366F1"],
+            default="#6B7280"
+        )
+        # 賃貸は別色（薄いグレー）
+        colors = np.where(types == "賃貸", "#9CA3AF", colors)
 
         # マーカーサイズ（含み益に応じて）
-        radius = max(8, min(20, 8 + abs(gain) / 100))
-
-        folium.CircleMarker(
-            location=[prop["lat"], prop["lng"]],
-            radius=radius,
-            color=color,
-            fill=True,
-            fillColor=color,
-            fillOpacity=0.7,
-            popup=folium.Popup(popup_html, max_width=300),
-            tooltip=f"{prop.get('name', '不明')} (+¥{gain:,.0f}m)"
-        ).add_to(m)
+        radii = np.clip(8 + np.abs(gains) / 100, 8, 20)
+
+        return colors, radii
+
+    def _property_marker_data(self, prop: Dict, color: str, radius: float) -> Dict:
+        """物件マーカー1件分の描画データ（ポップアップはブラウザ側でテンプレートから生成）"""
+        # 数値でない値（"N/A" など）は書式指定に渡さない
+        area = self._as_number(prop.get("land_area_sqm"))
+        area_str = f"{area:,.0f} ㎡" if area is not None else "N/A"
+        book_value = self._as_number(prop.get("book_value_million_yen")) or 0
+        estimated_value = self._as_number(prop.get("estimated_value_million_yen")) or 0
+        gain = self._as_number(prop.get("unrealized_gain_million_yen")) or 0
+        prop_type = prop.get("type", "不明")
+
+        name = html.escape(str(prop.get("name", "不明")))
+
+        return {
+            "lat": prop["lat"],
+            "lng": prop["lng"],
+            "color": color,
+            "radius": radius,
+            "tooltip": f"{name} (+¥{gain:,.0f}m)",
+            # 以下は _POPUP_TEMPLATE の差し込み値
+            "name": name,
+            "type": html.escape(str(prop_type)),
+            "address": html.escape(str(prop.get("address", "不明"))),
+            "land_area": area_str,
+            "book_value": f"{book_value:,.0f}",
+            "estimated_value": f"{estimated_value:,.0f}",
+            "gain": f"{'+' if gain > 0 else ''}¥{gain:,.0f}m",
+            "gain_bg": "#D1FAE5" if gain > 0 else "#FEE2E2",
+            "gain_color": "#059669" if gain > 0 else "#DC2626",
+            "notes": html.escape(str(prop.get("estimation_notes") or ""))
+        }
+
+    @staticmethod
+    def _as_number(value) -> Optional[float]:
+        """数値ならそのまま、それ以外（None・文字列・bool）はNone"""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        return None
 
     def _generate_title_html(
         self,
@@ -202,162 +566,49 @@ class MapGenerator:
         total_gain: float
     ) -> str:
         """タイトルとサマリーのHTML"""
-        return f"""
-        <div style="
-            position: fixed;
-            top: 10px;
-            left: 60px;
-            z-index: 1000;
-            background: white;
-            padding: 15px 20px;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-            font-family: 'Helvetica Neue', sans-serif;
-        ">
-            <h2 style="margin: 0 0 5px 0; font-size: 18px; color: #1F2937;">
-                {company_name} 不動産含み益解析
-            </h2>
-            <p style="margin: 0 0 10px 0; font-size: 12px; color: #6B7280;">
-                有価証券報告書 簿価 vs 公示地価・基準地価
-            </p>
-            <div style="display: flex; gap: 20px;">
-                <div>
-                    <div style="font-size: 11px; color: #6B7280;">保有土地簿価計</div>
-                    <div style="font-size: 16px; font-weight: bold;">¥{total_book:,.0f} 百万円</div>
-                </div>
-                <div>
-                    <div style="font-size: 11px; color: #6B7280;">含み益合計</div>
-                    <div style="font-size: 16px; font-weight: bold; color: #10B981;">
-                        +¥{total_gain:,.0f} 百万円
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
+        return _TITLE_TEMPLATE.substitute(
+            company_name=company_name,
+            total_book=f"{total_book:,.0f}",
+            total_gain=f"{total_gain:,.0f}"
+        )
 
     def _generate_legend_html(self) -> str:
         """凡例HTML"""
-        return """
-        <div style="
-            position: fixed;
-            bottom: 30px;
-            right: 10px;
-            z-index: 1000;
-            background: white;
-            padding: 10px 15px;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-            font-family: 'Helvetica Neue', sans-serif;
-            font-size: 12px;
-        ">
-            <div style="font-weight: bold; margin-bottom: 8px;">凡例 (Ownership)</div>
-            <div style="display: flex; align-items: center; margin-bottom: 4px;">
-                <span style="display: inline-block; width: 12px; height: 12px; background: #10B981; border-radius: 50%; margin-right: 8px;"></span>
-                自社保有 (Owned)
-            </div>
-            <div style="display: flex; align-items: center;">
-                <span style="display: inline-block; width: 12px; height: 12px; background: #9CA3AF; border-radius: 50%; margin-right: 8px;"></span>
-                賃貸 (Leased)
-            </div>
-        </div>
-        """
+        return _LEGEND_HTML
 
     def _generate_sidebar_html(self, properties: List[Dict]) -> str:
         """サイドバー（物件リスト）HTML"""
-        items_html = ""
-
-        # 含み益順にソート
+        # 含み益を一度だけ取り出してから含み益順にソート
         sorted_props = sorted(
-            properties,
-            key=lambda x: x.get("unrealized_gain_million_yen", 0) or 0,
+            ((self._as_number(p.get("unrealized_gain_million_yen")) or 0, p) for p in properties),
+            key=itemgetter(0),
             reverse=True
         )
 
-        for prop in sorted_props:
-            gain = prop.get("unrealized_gain_million_yen", 0) or 0
-            gain_color = "#10B981" if gain > 0 else "#DC2626"
-
-            items_html += f"""
-            <div style="
-                padding: 12px;
-                border-bottom: 1px solid #E5E7EB;
-                cursor: pointer;
-            " onmouseover="this.style.background='#F9FAFB'" onmouseout="this.style.background='white'">
-                <div style="font-weight: 500; margin-bottom: 4px;">{prop.get('name', '不明')}</div>
-                <div style="font-size: 11px; color: #6B7280; margin-bottom: 4px;">
-                    {prop.get('address', '')[:30]}...
-                </div>
-                <div style="display: flex; justify-content: space-between;">
-                    <span style="color: #6B7280;">簿価: ¥{prop.get('book_value_million_yen', 0) or 0:,.0f}m</span>
-                    <span style="color: {gain_color}; font-weight: bold;">
-                        {'+' if gain > 0 else ''}¥{gain:,.0f}m
-                    </span>
-                </div>
-            </div>
-            """
+        items_html = "".join(
+            self._generate_sidebar_item_html(prop, gain) for gain, prop in sorted_props
+        )
 
-        return f"""
-        <div id="sidebar" style="
-            position: fixed;
-            top: 10px;
-            left: 10px;
-            width: 280px;
-            max-height: calc(100vh - 20px);
-            z-index: 999;
-            background: white;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-            font-family: 'Helvetica Neue', sans-serif;
-            display: none;
-        ">
-            <div style="
-                padding: 15px;
-                border-bottom: 1px solid #E5E7EB;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-            ">
-                <span style="font-weight: bold;">物件一覧</span>
-                <button onclick="document.getElementById('sidebar').style.display='none'" style="
-                    background: none;
-                    border: none;
-                    font-size: 18px;
-                    cursor: pointer;
-                    color: #6B7280;
-                ">×</button>
-            </div>
-            <div style="overflow-y: auto; max-height: calc(100vh - 80px);">
-                {items_html}
-            </div>
-        </div>
+        return _SIDEBAR_TEMPLATE.substitute(items_html=items_html)
 
-        <button onclick="
-            var sb = document.getElementById('sidebar');
-            sb.style.display = sb.style.display === 'none' ? 'block' : 'none';
-        " style="
-            position: fixed;
-            top: 120px;
-            left: 60px;
-            z-index: 1000;
-            background: white;
-            border: none;
-            padding: 8px 12px;
-            border-radius: 4px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-            cursor: pointer;
-            font-family: 'Helvetica Neue', sans-serif;
-            font-size: 13px;
-        ">
-            📋 物件一覧
-        </button>
-        """
+    def _generate_sidebar_item_html(self, prop: Dict, gain: float) -> str:
+        """サイドバーの物件1件分のHTML"""
+        return _SIDEBAR_ITEM_TEMPLATE.substitute(
+            name=prop.get('name', '不明'),
+            address=prop.get('address', '')[:30],
+            book_value=f"{self._as_number(prop.get('book_value_million_yen')) or 0:,.0f}",
+            gain_color="#10B981" if gain > 0 else "#DC2626",
+            gain=f"{'+' if gain > 0 else ''}¥{gain:,.0f}m"
+        )
 
     def _generate_empty_map(self, company_name: str, output_path: str) -> str:
         """物件がない場合の空マップ"""
         m = folium.Map(
             location=[35.6812, 139.7671],  # 東京
             zoom_start=5,
-            tiles="cartodbpositron"
+            tiles=self.tiles,
+            attr=self.tiles_attr,
+            prefer_canvas=True
         )
 
         error_html = f"""
@@ -378,7 +629,7 @@ class MapGenerator:
         </div>
         """
         m.get_root().html.add_child(folium.Element(error_html))
-        m.save(output_path)
+        self._save_map(m, output_path)
 
         return output_path
 
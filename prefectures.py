@@ -0,0 +1,25 @@
+"""
+都道府県の定数モジュール
+住所の解析（claude_parser）と地価推計（land_price）で共有する
+"""
+
+import re
+
+
+# JIS都道府県コード順（01: 北海道 〜 47: 沖縄県）
+PREFECTURES = [
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
+    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
+    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県",
+    "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県",
+    "奈良県", "和歌山県", "鳥取県", "島根県", "岡山県", "広島県", "山口県",
+    "徳島県", "香川県", "愛媛県", "高知県", "福岡県", "佐賀県", "長崎県",
+    "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県"
+]
+
+# 都道府県名 → JIS都道府県コード（"01"〜"47"）
+PREFECTURE_CODES = {name: f"{i:02d}" for i, name in enumerate(PREFECTURES, 1)}
+
+# 47都道府県名を1つの正規表現にまとめ、住所を1回の走査で判定する
+# （pandas の str.extract でも使えるようグループで囲む）
+PREFECTURE_RE = re.compile("(" + "|".join(map(re.escape, PREFECTURES)) + ")")
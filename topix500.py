@@ -5,7 +5,7 @@ JPXのウェブサイトからTOPIX500構成銘柄を取得
 
 import requests
 import pandas as pd
-from io import BytesIO
+import tempfile
 from typing import List, Dict, Optional
 import json
 from pathlib import Path
@@ -24,6 +24,8 @@ class TOPIX500Fetcher:
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         self.cache_file = self.cache_dir / "topix500.json"
+        # JPXのExcelの解析結果と、条件付きGET用のETag/Last-Modified
+        self.jpx_cache_file = self.cache_dir / "jpx_topix_weight.json"
 
     def fetch_topix500(self, use_cache: bool = True) -> List[Dict]:
         """
@@ -53,26 +55,49 @@ class TOPIX500Fetcher:
     def _fetch_from_jpx(self) -> List[Dict]:
         """JPXからTOPIX構成銘柄を取得"""
         try:
-            response = requests.get(self.JPX_URL, timeout=30)
-            response.raise_for_status()
-
-            # Excelファイルを読み込み
-            df = pd.read_excel(BytesIO(response.content), skiprows=1)
+            # 前回取得時から更新がなければ304が返り、ダウンロードとExcelの解析を省ける
+            cached = self._load_jpx_cache()
+            headers = {}
+            if cached:
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+            with requests.get(
+                self.JPX_URL, headers=headers, timeout=30, stream=True
+            ) as response:
+                if response.status_code == 304 and cached:
+                    return cached["stocks"]
+                response.raise_for_status()
+
+                # Excelファイルを読み込み（本文をメモリに溜めず一時ファイルへ書きながら受信）
+                with tempfile.TemporaryFile() as tmp:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        tmp.write(chunk)
+                    tmp.seek(0)
+                    df = pd.read_excel(tmp, skiprows=1)
 
             # カラム名を正規化
             df.columns = df.columns.str.strip()
 
-            stocks = []
-            for _, row in df.iterrows():
-                code = str(row.get("コード", row.get("銘柄コード", ""))).strip()
-                name = str(row.get("銘柄名", row.get("銘柄", ""))).strip()
+            code_col = next((c for c in ("コード", "銘柄コード") if c in df.columns), None)
+            name_col = next((c for c in ("銘柄名", "銘柄") if c in df.columns), None)
+            if code_col is None:
+                return []
+
+            # 4桁の証券コードの行だけを列単位でまとめて抽出
+            codes = df[code_col].astype(str).str.strip()
+            names = df[name_col].astype(str).str.strip() if name_col else pd.Series("", index=df.index)
+            mask = codes.str.fullmatch(r"\d{4}")
+
+            stocks = pd.DataFrame({
+                "code": codes[mask],
+                "name": names[mask],
+                "edinet_code": None  # 後で紐付け
+            }).to_dict("records")
 
-                if code and code.isdigit() and len(code) == 4:
-                    stocks.append({
-                        "code": code,
-                        "name": name,
-                        "edinet_code": None  # 後で紐付け
-                    })
+            self._save_jpx_cache(response, stocks)
 
             return stocks
 
@@ -80,6 +105,30 @@ class TOPIX500Fetcher:
             print(f"JPXからの取得に失敗: {e}")
             return self._get_fallback_list()
 
+    def _load_jpx_cache(self) -> Optional[Dict]:
+        """前回のJPX取得結果を読み込む"""
+        if not self.jpx_cache_file.exists():
+            return None
+        try:
+            with open(self.jpx_cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _save_jpx_cache(self, response: requests.Response, stocks: List[Dict]):
+        """JPX取得結果を検証用ヘッダーとともに保存"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+
+        with open(self.jpx_cache_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "etag": etag,
+                "last_modified": last_modified,
+                "stocks": stocks
+            }, f, ensure_ascii=False)
+
     def _get_fallback_list(self) -> List[Dict]:
         """フォールバック: 主要銘柄のハードコードリスト"""
         # TOPIX500の代表的な銘柄（時価総額上位）
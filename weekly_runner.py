@@ -5,32 +5,28 @@
 """
 
 import argparse
-import json
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Manager
 from pathlib import Path
 from datetime import datetime
 
 from topix500 import TOPIX500Fetcher
-from main import RealEstateAnalyzer
+from main import (
+    init_worker, analyze_in_worker, create_shared_rate_limits,
+    load_results, append_result, consolidate_results
+)
 
 
-def get_progress(results_file: Path) -> dict:
+def get_progress(output_path: Path) -> dict:
     """進捗状況を取得"""
-    if results_file.exists():
-        with open(results_file, "r", encoding="utf-8") as f:
-            results = json.load(f)
-
-        analyzed_codes = {r["stock_code"] for r in results if not r.get("error")}
-        return {
-            "results": results,
-            "analyzed_codes": analyzed_codes,
-            "count": len(analyzed_codes)
-        }
+    results = load_results(output_path)
 
+    analyzed_codes = {r["stock_code"] for r in results if not r.get("error")}
     return {
-        "results": [],
-        "analyzed_codes": set(),
-        "count": 0
+        "results": results,
+        "analyzed_codes": analyzed_codes,
+        "count": len(analyzed_codes)
     }
 
 
@@ -38,10 +34,9 @@ def run_batch(batch_size: int = 10, output_dir: str = "./output"):
     """バッチ実行"""
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
-    results_file = output_path / "analysis_results.json"
 
     # 進捗を取得
-    progress = get_progress(results_file)
+    progress = get_progress(output_path)
     print(f"現在の進捗: {progress['count']}社 解析済み")
 
     # TOPIX500銘柄を取得
@@ -65,18 +60,14 @@ def run_batch(batch_size: int = 10, output_dir: str = "./output"):
     batch = pending_stocks[:batch_size]
     print(f"今回の解析対象: {len(batch)}社")
 
-    # 解析実行
-    analyzer = RealEstateAnalyzer(output_dir=output_dir)
-
-    results = progress["results"].copy()
-
+    jobs = []
     for stock in batch:
         stock_code = stock["code"]
         company_name = stock["name"]
         edinet_code = stock.get("edinet_code") or edinet_mapping.get(stock_code)
 
         if not edinet_code:
-            results.append({
+            append_result(output_path, {
                 "stock_code": stock_code,
                 "company_name": company_name,
                 "error": "EDINETコードが見つかりません",
@@ -84,16 +75,23 @@ def run_batch(batch_size: int = 10, output_dir: str = "./output"):
             })
             continue
 
-        result = analyzer.analyze_single_company(stock_code, company_name, edinet_code)
-        results.append(result)
-
-        # 中間保存
-        with open(results_file, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-
-    # 最終結果を保存
-    with open(results_file, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+        jobs.append((stock_code, company_name, edinet_code))
+
+    # 解析実行（企業ごとにプロセスを分けて並列実行し、終わった順に追記ログへ保存）
+    # Nominatim・国交省API・EDINETのレート制限はプロセス間で共有し、プロセス数によらず上限を守る
+    if jobs:
+        workers = min(os.cpu_count() or 1, len(jobs))
+        with Manager() as manager, ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(output_dir, create_shared_rate_limits(manager))
+        ) as executor:
+            futures = [executor.submit(analyze_in_worker, job) for job in jobs]
+            for future in as_completed(futures):
+                append_result(output_path, future.result())
+
+    # 追記ログを analysis_results.json にまとめる
+    results = consolidate_results(output_path)
 
     # サマリー出力
     successful = [r for r in results if not r.get("error")]